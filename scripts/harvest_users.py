@@ -0,0 +1,480 @@
+import os
+import time
+import random
+import queue
+import threading
+import requests
+import pandas as pd
+from profiling import profiled, stage
+from records import write_records
+from scrape_anime_user_info import extract_usernames, log_skipped, parse_rating_entry, req_head, sleep, write_new_row
+
+USERS_HOST = 'myanimelist.net'
+USERS_URL = 'https://myanimelist.net/users.php'
+API_HOST = 'api.myanimelist.net'
+ANIMELIST_URL = 'https://api.myanimelist.net/v2/users/{}/animelist?limit=1000&nsfw=true&fields=list_status'
+
+
+def classify_response(response):
+    """
+    Classify an API response so that private lists can be told apart from rate limiting
+
+    Parameters
+    ----------
+    response : requests.models.Response
+        Response from the animelist API.
+
+    Returns
+    -------
+    str
+        'ok', 'forbidden' (403 returned by the API itself, usually a private list), 'throttled'
+        (429, Retry-After, or a 403 error page served in front of the API), 'missing' (404) or 'error'.
+
+    """
+    if response.status_code == 200:
+        return 'ok'
+    if response.status_code == 404:
+        return 'missing'
+    if response.status_code == 429 or 'Retry-After' in response.headers:
+        return 'throttled'
+    if response.status_code == 403:
+        # The API answers restricted lists with a JSON error body, throttling is served as an HTML page
+        try:
+            body = response.json()
+        except ValueError:
+            return 'throttled'
+        return 'forbidden' if isinstance(body, dict) else 'throttled'
+    return 'error'
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing requests evenly at a fixed rate across all workers.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_t = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, host=None):
+        with self.lock:
+            now = time.monotonic()
+            t = max(now, self.next_t)
+            self.next_t = t + self.interval
+        if t > now:
+            time.sleep(t - now)
+
+
+class RequestScheduler:
+    """
+    Divides a total request budget between hosts using one token bucket per host.
+
+    Each host refills at its share of the total rate. A host whose bucket is empty may borrow a token
+    from a host whose bucket is full, i.e. one that is not using its share, so an idle stage never
+    leaves budget unused.
+    """
+
+    def __init__(self, rate, shares):
+        # A host with no share would never refill and wait on a zero rate
+        if rate <= 0 or any(share <= 0 for share in shares.values()):
+            raise ValueError(f'Request rate and every host share must be positive, got rate={rate}, shares={shares}')
+        self.rates = {host: rate * share for host, share in shares.items()}
+        self.capacity = {host: max(1.0, r) for host, r in self.rates.items()}
+        self.tokens = dict(self.capacity)
+        self.last_t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_t
+        self.last_t = now
+        for host, r in self.rates.items():
+            self.tokens[host] = min(self.capacity[host], self.tokens[host] + elapsed * r)
+
+    def acquire(self, host):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens[host] >= 1:
+                    self.tokens[host] -= 1
+                    return
+                for other, tokens in self.tokens.items():
+                    if other != host and tokens >= self.capacity[other]:
+                        self.tokens[other] -= 1
+                        return
+                wait = (1 - self.tokens[host]) / self.rates[host]
+            time.sleep(min(wait, 0.25))
+
+
+class ThrottleState:
+    """
+    Outcomes shared across workers, used to decide whether 403 responses mean private lists or throttling.
+
+    A 403 with an API error body is held as a suspect. The next successful response from any worker
+    shows the API is serving us, so the suspects are confirmed private. If streak_limit such 403s arrive
+    in a row across the pool with no success in between, they are treated as throttling: the pool is
+    paused with exponential backoff and the suspects are returned for retry.
+    """
+
+    def __init__(self, streak_limit, base_pause=60, max_pause=600):
+        self.streak_limit = streak_limit
+        self.base_pause = base_pause
+        self.max_pause = max_pause
+        self.pause = base_pause
+        self.pause_until = 0.0
+        self.streak = 0
+        self.suspects = []
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            remaining = self.pause_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _throttle(self):
+        now = time.monotonic()
+        # Only the first worker to see throttling extends the pause, the others join it
+        if now >= self.pause_until:
+            t = self.pause * (1 + random.random() * 0.25)
+            self.pause_until = now + t
+            self.pause = min(self.pause * 2, self.max_pause)
+            print(f"Rate limiting detected, pausing all workers for {t:.0f}s")
+        requeue = self.suspects
+        self.suspects = []
+        self.streak = 0
+        return requeue
+
+    def record_ok(self):
+        with self.lock:
+            self.streak = 0
+            self.pause = self.base_pause
+            confirmed = self.suspects
+            self.suspects = []
+        return confirmed
+
+    def record_forbidden(self, item):
+        with self.lock:
+            self.streak += 1
+            self.suspects.append(item)
+            if self.streak >= self.streak_limit:
+                return self._throttle()
+        return []
+
+    def record_throttled(self, item):
+        with self.lock:
+            return self._throttle() + [item]
+
+    def drain(self):
+        with self.lock:
+            remaining = self.suspects
+            self.suspects = []
+        return remaining
+
+
+class Harvester:
+    """
+    Worker pool scraping the anime lists of submitted usernames in parallel.
+
+    Ratings are buffered and appended to output_file in batches; private, deleted and repeatedly
+    failing users are appended to log_file, and both are also upserted into sink when one is given.
+    Requests go through acquire(host), a shared rate limiter by default.
+    """
+
+    def __init__(self, req_head=req_head, n_workers=8, rate=3.0, acquire=None, max_pending=None, max_attempts=5,
+                 log_file='skipped_users_list.csv', output_file='user_ratings.csv', flush_rows=5000, sink=None):
+        self.req_head = req_head
+        self.n_workers = n_workers
+        self.acquire = acquire or RateLimiter(rate).acquire
+        self.max_attempts = max_attempts
+        self.log_file = log_file
+        self.output_file = output_file
+        self.flush_rows = flush_rows
+        self.sink = sink
+        max_pending = max_pending or 4 * n_workers
+        # Suspects keep their slots, so once every slot holds one the streak must already count as throttling
+        self.state = ThrottleState(streak_limit=min(2 * n_workers + 2, max_pending))
+        self.queue = queue.Queue()
+        self.slots = threading.Semaphore(max_pending)
+        self.write_lock = threading.Lock()
+        self.ratings = []
+        self.processed = 0
+        self.skipped = 0
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(n_workers)]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def submit(self, pos, username):
+        """
+        Queue a username for scraping, blocking while max_pending users are already in flight.
+
+        Parameters
+        ----------
+        pos : int
+            id given to the username, written as User_Id.
+        username : str
+            username string of our target user.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.slots.acquire()
+        self.queue.put((pos, username, 0))
+
+    def close(self):
+        """
+        Wait for all submitted users to finish, stop the workers and flush remaining output.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.queue.join()
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        # Suspects never followed by a success are logged the same way the sequential scraper would
+        for pos, username, _ in self.state.drain():
+            self._log_skipped(pos, username)
+        self._flush(force=True)
+        if self.sink is not None:
+            self.sink.flush()
+        print(f'Harvest finished: {self.processed} users scraped, {self.skipped} skipped')
+
+    def _worker(self):
+        session = requests.Session()
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                try:
+                    self._process(session, item)
+                except Exception as e:
+                    # Any unexpected failure is retried like an error response so the worker and the user's slot survive
+                    print(f'Error processing user {item[0]} ({item[1]}): {e!r}')
+                    self._retry([item])
+            finally:
+                self.queue.task_done()
+
+    def _fetch(self, session, pos, username):
+        link = ANIMELIST_URL.format(username)
+        ratings_list = []
+        while link:
+            self.state.wait()
+            self.acquire(API_HOST)
+            try:
+                response = session.get(link, headers=self.req_head, timeout=30)
+            except requests.RequestException:
+                return 'error', None
+            outcome = classify_response(response)
+            if outcome != 'ok':
+                return outcome, None
+            for p, u, _ in self.state.record_ok():
+                self._log_skipped(p, u)
+            with stage('animelist'):
+                # A 200 maintenance page or an unexpected payload is retried like any other error
+                try:
+                    page = response.json()
+                    for json in page['data']:
+                        ratings_list.append(parse_rating_entry(json, username, pos))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    return 'error', None
+            link = page.get('paging', {}).get('next')
+        return 'ok', ratings_list
+
+    def _process(self, session, item):
+        # A submitted user holds a slot until it is written to output_file or log_file
+        pos, username, attempt = item
+        outcome, ratings_list = self._fetch(session, pos, username)
+        if outcome == 'ok':
+            with self.write_lock:
+                self.ratings.extend(ratings_list)
+                self.processed += 1
+                if not self.processed % 100:
+                    print(f'Current number of usernames processed: {self.processed}, skipped: {self.skipped}')
+            self.slots.release()
+            self._flush()
+            return
+        if outcome == 'missing':
+            self._log_skipped(pos, username)
+            return
+        if outcome == 'forbidden':
+            retry = self.state.record_forbidden(item)
+        elif outcome == 'throttled':
+            retry = self.state.record_throttled(item)
+        else:
+            time.sleep(5)
+            retry = [item]
+        self._retry(retry)
+
+    def _retry(self, items):
+        for p, u, a in items:
+            if a + 1 >= self.max_attempts:
+                self._log_skipped(p, u)
+            else:
+                self.queue.put((p, u, a + 1))
+
+    def _flush(self, force=False):
+        with self.write_lock:
+            if not self.ratings or (not force and len(self.ratings) < self.flush_rows):
+                return
+            # On a write error the rows stay buffered and are retried on the next flush
+            try:
+                with stage('csv_write'):
+                    write_records(self.output_file, self.ratings)
+            except Exception as e:
+                print(f'Error writing {len(self.ratings)} buffered ratings: {e!r}')
+                if force:
+                    raise
+                return
+            # Once in output_file the rows leave the buffer, so a sink failure never appends them again
+            rows, self.ratings = self.ratings, []
+            if self.sink is not None:
+                self._upsert_ratings(rows)
+
+    def _upsert_ratings(self, rows):
+        # Rows the sink buffered before a failed flush stay in its buffer and are retried by its next flush
+        try:
+            try:
+                self.sink.upsert('user_ratings', rows)
+            except ValueError:
+                # A row without a key rejects the whole batch, so the rest are upserted one by one
+                for row in rows:
+                    try:
+                        self.sink.upsert('user_ratings', [row])
+                    except ValueError as e:
+                        print(f'Dropping rating from sink: {e}')
+        except Exception as e:
+            print(f'Error upserting {len(rows)} ratings into sink: {e!r}')
+
+    def _log_skipped(self, pos, username):
+        try:
+            with self.write_lock:
+                self.skipped += 1
+                log_skipped(self.log_file, pos, username)
+                if self.sink is not None:
+                    self.sink.upsert('skipped_users', [(pos, username)])
+        except Exception as e:
+            print(f'Error logging skipped user {pos} ({username}): {e!r}')
+        finally:
+            self.slots.release()
+
+
+@profiled
+def harvest_user_animelists(usernames, req_head=req_head, pos=0, n_workers=8, rate=3.0, log_file='skipped_users_list.csv', output_file='user_ratings.csv', sink=None):
+    """
+    Scrape anime list information of each username with a pool of parallel workers
+
+    Parameters
+    ----------
+    usernames : List
+        List of usernames to scrape from.
+    req_head : Dict, optional
+        Request headers to include in our request. The default is req_head.
+    pos : int, optional
+        Current positional index from usernames. The default is 0.
+    n_workers : int, optional
+        Number of parallel workers. The default is 8.
+    rate : float, optional
+        Maximum number of requests per second across all workers. The default is 3.0.
+    log_file : str, optional
+        File path / file name of our .csv file to record private, deleted or failing usernames. The default is 'skipped_users_list.csv'.
+    output_file : str, optional
+        File path / file name of our .csv file to record our scraped data. The default is 'user_ratings.csv'.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the scraped rows into. The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+    harvester = Harvester(req_head, n_workers=n_workers, rate=rate, log_file=log_file, output_file=output_file, sink=sink).start()
+    for i in range(pos, len(usernames)):
+        harvester.submit(i, usernames[i])
+    harvester.close()
+
+
+@profiled
+def scrape_users_pipeline(req_head=req_head, file_name='usernames_list.csv', target=20000, n_workers=8, rate=3.0, users_share=0.1, queue_size=200, log_file='skipped_users_list.csv', output_file='user_ratings.csv', sink=None):
+    """
+    Discover usernames and scrape their anime lists at the same time
+
+    Each new username found on the user page is appended to file_name and submitted straight to the
+    harvester, whose bounded queue pauses discovery when the workers fall behind. Both stages draw from
+    one RequestScheduler, with users_share of the budget reserved for the user page host.
+
+    Parameters
+    ----------
+    req_head : Dict, optional
+        Request headers to include in our request. The default is req_head.
+    file_name : str, optional
+        File path / file name of our .csv file of usernames. The default is 'usernames_list.csv'.
+    target : int, optional
+        Our target number of usernames. The default is 20000.
+    n_workers : int, optional
+        Number of parallel harvest workers. The default is 8.
+    rate : float, optional
+        Maximum number of requests per second across both hosts. The default is 3.0.
+    users_share : float, optional
+        Share of the request budget reserved for the user page host, strictly between 0 and 1. The default is 0.1.
+    queue_size : int, optional
+        Maximum number of discovered usernames waiting to be harvested. The default is 200.
+    log_file : str, optional
+        File path / file name of our .csv file to record private, deleted or failing usernames. The default is 'skipped_users_list.csv'.
+    output_file : str, optional
+        File path / file name of our .csv file to record our scraped data. The default is 'user_ratings.csv'.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the scraped rows into. The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+    scheduler = RequestScheduler(rate, {USERS_HOST: users_share, API_HOST: 1 - users_share})
+    harvester = Harvester(req_head, n_workers=n_workers, acquire=scheduler.acquire, max_pending=queue_size,
+                          log_file=log_file, output_file=output_file, sink=sink).start()
+    # Usernames keep their line position in the file as User_Id, so new ones start after the last line
+    if os.path.exists(file_name):
+        existing = pd.read_csv(file_name, delimiter='|', header=None).values.ravel()
+    else:
+        existing = []
+    current_set = set(existing)
+    pos = len(existing)
+    session = requests.Session()
+    # Closing in finally flushes the buffered ratings even when discovery is interrupted
+    try:
+        while len(current_set) < target:
+            scheduler.acquire(USERS_HOST)
+            try:
+                data = session.get(USERS_URL, headers=req_head, timeout=30)
+            except requests.RequestException:
+                sleep(5)
+                continue
+            if data.status_code != 200:
+                print(f'-----------------------------{data.status_code} status code encountered on user page-----------------------------')
+                sleep(5)
+                continue
+            usernames = list(dict.fromkeys(extract_usernames(data, current_set)))
+            current_set.update(usernames)
+            with stage('csv_write'):
+                write_new_row(file_name, usernames)
+            if sink is not None:
+                sink.upsert('usernames', [(pos + k, u) for k, u in enumerate(usernames)])
+            for username in usernames:
+                harvester.submit(pos, username)
+                pos += 1
+            print(f'Current number of usernames found: {len(current_set)}')
+    finally:
+        harvester.close()
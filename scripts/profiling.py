@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import functools
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Opt-in profiling is enabled by setting MAL_PROFILE=1, MAL_PROFILE_ALLOC=1 additionally enables tracemalloc
+PROFILE_ENV = 'MAL_PROFILE'
+PROFILE_ALLOC_ENV = 'MAL_PROFILE_ALLOC'
+PROFILE_PATH = 'profiles'
+
+# Leaf frames of threads blocked in sleeps, lock / queue waits and socket reads, used when per-thread
+# CPU clocks are unavailable (e.g. on Windows)
+IDLE_FUNCS = {'sleep', 'wait', 'acquire', 'readinto', 'recv_into', 'select', 'poll'}
+
+_local = threading.local()
+_active = None
+
+
+def env_flag(name):
+    """
+    Read an on/off environment variable, treating unset, empty, '0', 'false', 'no' and 'off' as off.
+
+    Parameters
+    ----------
+    name : str
+        Environment variable name.
+
+    Returns
+    -------
+    bool
+        Whether the flag is on.
+
+    """
+    return os.environ.get(name, '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+def thread_cpu_time(tid):
+    """
+    CPU time consumed by another thread, or None where per-thread CPU clocks are not supported.
+
+    Parameters
+    ----------
+    tid : int
+        Thread identifier from threading.get_ident().
+
+    Returns
+    -------
+    float
+        Thread CPU time in seconds, or None.
+
+    """
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(tid))
+    except (AttributeError, OSError, ValueError, OverflowError):
+        return None
+
+
+class Profiler:
+    """
+    Sampling profiler attributing CPU samples and allocations to named stages.
+
+    A daemon thread snapshots the stacks of all other threads every `interval` seconds,
+    so the cost is independent of how many functions the scraper calls. A sample only counts as CPU
+    when the thread's CPU clock advanced since the previous tick (or, without per-thread clocks, when
+    its leaf frame is not a known blocking call); other samples are counted as idle per stage and kept
+    out of the hotspot report and the flamegraph.
+    """
+
+    def __init__(self, name, interval=0.01, trace_allocs=False, out_dir=PROFILE_PATH, top_n=25):
+        self.name = name
+        self.interval = interval
+        self.trace_allocs = trace_allocs
+        self.started_tracing = False
+        self.out_dir = out_dir
+        self.top_n = top_n
+        self.stacks = Counter()
+        self.self_samples = Counter()
+        self.stage_samples = Counter()
+        self.idle_samples = Counter()
+        self.last_cpu = {}
+        self.stage_time = defaultdict(float)
+        self.stage_cpu = defaultdict(float)
+        self.stage_calls = Counter()
+        self.alloc_net = Counter()
+        self.alloc_peak = Counter()
+        self.thread_stages = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        if self.trace_allocs and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            self.started_tracing = True
+        self.start_time = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.start_time
+        # Tracing started by the caller is left running
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own_id:
+                    continue
+                stages = self.thread_stages.get(tid)
+                stage_path = '/'.join(stages) if stages else 'other'
+                cpu = thread_cpu_time(tid)
+                last = self.last_cpu.get(tid)
+                self.last_cpu[tid] = cpu
+                if cpu is not None:
+                    # Less than a tenth of the interval on CPU means the thread spent the tick blocked
+                    idle = last is None or cpu - last < 0.1 * self.interval
+                else:
+                    idle = frame.f_code.co_name in IDLE_FUNCS
+                if idle:
+                    self.idle_samples[stage_path] += 1
+                    continue
+                funcs = []
+                while frame is not None:
+                    code = frame.f_code
+                    funcs.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                funcs.reverse()
+                self.stacks[';'.join([stage_path] + funcs)] += 1
+                self.self_samples[funcs[-1]] += 1
+                self.stage_samples[stage_path] += 1
+
+    def report(self):
+        """
+        Format the top-N hotspot report for this run.
+
+        Returns
+        -------
+        str
+            Report text.
+
+        """
+        total = sum(self.stage_samples.values()) or 1
+        lines = [f'Profile: {self.name}',
+                 f'Wall time: {self.elapsed:.2f}s, CPU samples: {total}, idle samples: {sum(self.idle_samples.values())}, interval: {self.interval}s', '']
+        lines.append('CPU samples by stage (idle samples spent sleeping / waiting on requests)')
+        for stage, n in self.stage_samples.most_common():
+            lines.append(f'  {100 * n / total:6.2f}%  {n:8d}  {self.idle_samples[stage]:8d} idle  {stage}')
+        for stage, n in self.idle_samples.most_common():
+            if stage not in self.stage_samples:
+                lines.append(f'  {0:6.2f}%  {0:8d}  {n:8d} idle  {stage}')
+        lines += ['', 'CPU / wall time by stage']
+        for stage, cpu in sorted(self.stage_cpu.items(), key=lambda x: -x[1]):
+            lines.append(f'  {cpu:10.3f}s  {self.stage_time[stage]:10.3f}s  {self.stage_calls[stage]:8d} calls  {stage}')
+        lines += ['', f'Top {self.top_n} hotspots (self CPU samples)']
+        for func, n in self.self_samples.most_common(self.top_n):
+            lines.append(f'  {100 * n / total:6.2f}%  {n:8d}  {func}')
+        if self.trace_allocs:
+            lines += ['', 'Allocations by page kind (net retained / peak)']
+            for kind in sorted(self.alloc_peak, key=lambda k: -self.alloc_peak[k]):
+                lines.append(f'  {self.alloc_net[kind] / 1024:12.1f} KiB  {self.alloc_peak[kind] / 1024:12.1f} KiB  {kind}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Write collapsed stacks (flamegraph.pl / speedscope compatible) and the hotspot report to out_dir.
+
+        Returns
+        -------
+        str
+            Path prefix of the written files.
+
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        prefix = os.path.join(self.out_dir, f"{self.name}_{time.strftime('%Y%m%d-%H%M%S')}")
+        with open(prefix + '.folded', 'w', encoding='utf-8') as f:
+            for stack, n in self.stacks.items():
+                f.write(f'{stack} {n}\n')
+        with open(prefix + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        print(f'Profile written to {prefix}.folded / {prefix}.txt')
+        return prefix
+
+
+@contextmanager
+def stage(name):
+    """
+    Mark a block of code as belonging to a named stage; a no-op unless a profiled run is active.
+
+    Parameters
+    ----------
+    name : str
+        Stage name, e.g. the page kind being processed. Nested stages are joined with '/'.
+
+    """
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    tid = threading.get_ident()
+    stages = getattr(_local, 'stages', None)
+    if stages is None or getattr(_local, 'profiler', None) is not profiler:
+        stages = _local.stages = []
+        _local.profiler = profiler
+        profiler.thread_stages[tid] = stages
+    stages.append(name)
+    path = '/'.join(stages)
+    # Allocation tracking is attributed to the outermost stage, i.e. the page kind; with several
+    # worker threads the traced memory is process-wide so concurrent stages share the deltas
+    track = profiler.trace_allocs and len(stages) == 1
+    if track:
+        tracemalloc.reset_peak()
+        mem_start = tracemalloc.get_traced_memory()[0]
+    t, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        profiler.stage_time[path] += time.perf_counter() - t
+        profiler.stage_cpu[path] += time.thread_time() - cpu
+        profiler.stage_calls[path] += 1
+        if track:
+            current, peak = tracemalloc.get_traced_memory()
+            profiler.alloc_net[name] += current - mem_start
+            profiler.alloc_peak[name] = max(profiler.alloc_peak[name], peak - mem_start)
+        stages.pop()
+
+
+def profiled(func):
+    """
+    Decorator for script entry points, profiling the whole run when MAL_PROFILE is enabled in the environment.
+
+    Parameters
+    ----------
+    func : Callable
+        Entry point function.
+
+    Returns
+    -------
+    Callable
+        Wrapped function.
+
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _active
+        if not env_flag(PROFILE_ENV) or _active is not None:
+            return func(*args, **kwargs)
+        profiler = Profiler(func.__name__,
+                            interval=float(os.environ.get('MAL_PROFILE_INTERVAL', 0.01)),
+                            trace_allocs=env_flag(PROFILE_ALLOC_ENV))
+        _active = profiler
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            _active = None
+            profiler.write()
+    return wrapper
@@ -0,0 +1,269 @@
+import os
+import ast
+import numpy as np
+import pandas as pd
+
+
+GRAPH_FILES = ['ids','indptr','indices','weights','rev_indptr','rev_indices','rev_weights']
+
+
+def parse_list_cell(cell):
+    """
+    Parse a stringified list from a .csv cell into a list of ints, dropping non-numeric values such as 'Error' or '?'
+
+    Parameters
+    ----------
+    cell : str
+        Cell content, e.g. "['5114', '9253']".
+
+    Returns
+    -------
+    values : List[int]
+        List of parsed integers.
+
+    """
+    try:
+        items = ast.literal_eval(cell) if isinstance(cell, str) else cell
+    except (ValueError, SyntaxError):
+        return []
+    if not isinstance(items, (list, tuple)):
+        return []
+    values = []
+    for x in items:
+        try:
+            values.append(int(x))
+        except (TypeError, ValueError):
+            values.append(None)
+    return values
+
+def build_csr(src, dst, w, n):
+    """
+    Build a CSR adjacency from edge arrays of dense node indices
+
+    Parameters
+    ----------
+    src : np.ndarray
+        Source node index of each edge.
+    dst : np.ndarray
+        Destination node index of each edge.
+    w : np.ndarray
+        Weight of each edge.
+    n : int
+        Number of nodes.
+
+    Returns
+    -------
+    indptr : np.ndarray
+        int64 array of length n+1, row i spans indices[indptr[i]:indptr[i+1]].
+    indices : np.ndarray
+        int32 destination node indices, each row sorted by descending weight.
+    weights : np.ndarray
+        uint32 edge weights.
+
+    """
+    # Sort by source, then by descending weight so top-k is a slice of the row
+    order = np.lexsort((-w.astype(np.int64), src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32), w[order].astype(np.uint32)
+
+def build_rec_graph(anime_info_file='anime_info.csv', out_dir='rec_graph'):
+    """
+    Build the weighted recommendation graph from the Recommended_Ids / Recommended_Counts columns and save it as .npy arrays
+
+    Parameters
+    ----------
+    anime_info_file : str, optional
+        File path / file name of the scraped anime info .csv file. The default is 'anime_info.csv'.
+    out_dir : str, optional
+        Directory to save the graph arrays to. The default is 'rec_graph'.
+
+    Returns
+    -------
+    None.
+
+    """
+    df = pd.read_csv(anime_info_file, delimiter='|', usecols=['MAL_Id','Recommended_Ids','Recommended_Counts'], dtype=str)
+    df = df[pd.to_numeric(df['MAL_Id'], errors='coerce').notna()]
+    # Re-runs append rows to anime_info.csv, the latest row of each title wins
+    df = df.assign(MAL_Id=pd.to_numeric(df['MAL_Id']).astype(int)).drop_duplicates('MAL_Id', keep='last')
+    src_ids, dst_ids, counts = [], [], []
+    for mal_id, rec_ids, rec_counts in zip(df['MAL_Id'], df['Recommended_Ids'], df['Recommended_Counts']):
+        for rec_id, count in zip(parse_list_cell(rec_ids), parse_list_cell(rec_counts)):
+            if rec_id is None or rec_id == mal_id:
+                continue
+            src_ids.append(mal_id)
+            dst_ids.append(rec_id)
+            counts.append(1 if count is None else count)
+
+    # Dense node index covers scraped titles and any recommended title outside the scraped set
+    ids = np.unique(np.concatenate([df['MAL_Id'].astype(np.int64).values, np.asarray(dst_ids, dtype=np.int64)])).astype(np.int32)
+    src = np.searchsorted(ids, np.asarray(src_ids, dtype=np.int32))
+    dst = np.searchsorted(ids, np.asarray(dst_ids, dtype=np.int32))
+    w = np.asarray(counts, dtype=np.uint32)
+
+    indptr, indices, weights = build_csr(src, dst, w, len(ids))
+    rev_indptr, rev_indices, rev_weights = build_csr(dst, src, w, len(ids))
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = [ids, indptr, indices, weights, rev_indptr, rev_indices, rev_weights]
+    for name, arr in zip(GRAPH_FILES, arrays):
+        np.save(os.path.join(out_dir, name + '.npy'), arr)
+    print(f'Saved recommendation graph with {len(ids)} titles and {len(indices)} edges to {out_dir}')
+
+def load_rec_graph(out_dir='rec_graph', mmap=True):
+    """
+    Load the recommendation graph arrays saved by build_rec_graph()
+
+    Parameters
+    ----------
+    out_dir : str, optional
+        Directory containing the graph arrays. The default is 'rec_graph'.
+    mmap : bool, optional
+        Memory-map the arrays instead of reading them into memory. The default is True.
+
+    Returns
+    -------
+    graph : Dict
+        Dict of arrays keyed by GRAPH_FILES.
+
+    """
+    mode = 'r' if mmap else None
+    return {name: np.load(os.path.join(out_dir, name + '.npy'), mmap_mode=mode) for name in GRAPH_FILES}
+
+def node_index(graph, anime_id):
+    """
+    Map a MAL_Id to its dense node index in the graph
+
+    Parameters
+    ----------
+    graph : Dict
+        Graph loaded by load_rec_graph().
+    anime_id : int
+        Anime title ID on the website.
+
+    Returns
+    -------
+    int
+        Dense node index.
+
+    """
+    ids = graph['ids']
+    i = int(np.searchsorted(ids, anime_id))
+    if i >= len(ids) or ids[i] != anime_id:
+        raise KeyError(f'Title Id {anime_id} not in recommendation graph')
+    return i
+
+def top_k_neighbors(graph, anime_id, k=10, reverse=False):
+    """
+    Return the k most recommended titles for a given title
+
+    Parameters
+    ----------
+    graph : Dict
+        Graph loaded by load_rec_graph().
+    anime_id : int
+        Anime title ID on the website.
+    k : int, optional
+        Number of neighbors to return. The default is 10.
+    reverse : bool, optional
+        Use incoming edges, i.e. titles that recommend the given title. The default is False.
+
+    Returns
+    -------
+    List[Tuple]
+        List of (MAL_Id, count) pairs sorted by descending count.
+
+    """
+    prefix = 'rev_' if reverse else ''
+    indptr, indices, weights = graph[prefix + 'indptr'], graph[prefix + 'indices'], graph[prefix + 'weights']
+    i = node_index(graph, anime_id)
+    start, end = indptr[i], min(indptr[i + 1], indptr[i] + k)
+    return list(zip(graph['ids'][indices[start:end]].tolist(), weights[start:end].tolist()))
+
+def k_hop(graph, anime_id, hops=2, reverse=False):
+    """
+    Return all titles reachable within a number of hops, with their hop distance
+
+    Parameters
+    ----------
+    graph : Dict
+        Graph loaded by load_rec_graph().
+    anime_id : int
+        Anime title ID on the website.
+    hops : int, optional
+        Maximum number of hops to expand. The default is 2.
+    reverse : bool, optional
+        Follow incoming edges instead of outgoing edges. The default is False.
+
+    Returns
+    -------
+    Dict
+        Dict mapping reachable MAL_Id to its hop distance, excluding the given title.
+
+    """
+    prefix = 'rev_' if reverse else ''
+    indptr, indices = graph[prefix + 'indptr'], graph[prefix + 'indices']
+    dist = np.full(len(graph['ids']), -1, dtype=np.int32)
+    frontier = np.array([node_index(graph, anime_id)])
+    dist[frontier] = 0
+    for h in range(1, hops + 1):
+        if not len(frontier):
+            break
+        nbrs = np.concatenate([indices[indptr[i]:indptr[i + 1]] for i in frontier])
+        nbrs = np.unique(nbrs)
+        frontier = nbrs[dist[nbrs] < 0]
+        dist[frontier] = h
+    reached = np.flatnonzero(dist > 0)
+    return dict(zip(graph['ids'][reached].tolist(), dist[reached].tolist()))
+
+def personalized_pagerank(graph, anime_ids, alpha=0.85, k=10, tol=1e-8, max_iter=100):
+    """
+    Rank titles by personalized PageRank seeded from one or more titles, with transitions weighted by recommendation counts
+
+    Parameters
+    ----------
+    graph : Dict
+        Graph loaded by load_rec_graph().
+    anime_ids : List[int]
+        Anime title IDs to personalize on.
+    alpha : float, optional
+        Damping factor, probability of following an edge rather than restarting. The default is 0.85.
+    k : int, optional
+        Number of top titles to return. The default is 10.
+    tol : float, optional
+        L1 convergence tolerance. The default is 1e-8.
+    max_iter : int, optional
+        Maximum number of power iterations. The default is 100.
+
+    Returns
+    -------
+    List[Tuple]
+        List of (MAL_Id, score) pairs for the top k titles, excluding the seed titles.
+
+    """
+    n = len(graph['ids'])
+    indptr, indices = np.asarray(graph['indptr']), np.asarray(graph['indices'])
+    weights = np.asarray(graph['weights'], dtype=np.float64)
+    out_degree = np.diff(indptr)
+    src = np.repeat(np.arange(n), out_degree)
+    row_sum = np.bincount(src, weights=weights, minlength=n)
+    prob = weights / row_sum[src]
+    dangling = row_sum == 0
+
+    seeds = [node_index(graph, a) for a in anime_ids]
+    restart = np.zeros(n)
+    restart[seeds] = 1.0 / len(seeds)
+    rank = restart.copy()
+    for _ in range(max_iter):
+        # Mass on titles without recommendations returns to the seeds
+        new_rank = alpha * np.bincount(indices, weights=rank[src] * prob, minlength=n)
+        new_rank += (alpha * rank[dangling].sum() + 1 - alpha) * restart
+        converged = np.abs(new_rank - rank).sum() < tol
+        rank = new_rank
+        if converged:
+            break
+    rank[seeds] = 0
+    top = np.argpartition(-rank, min(k, n - 1))[:k]
+    top = top[np.argsort(-rank[top])]
+    return [(int(graph['ids'][i]), float(rank[i])) for i in top if rank[i] > 0]
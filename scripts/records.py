@@ -0,0 +1,293 @@
+import os
+import re
+import pandas as pd
+
+
+def to_int(v):
+    """
+    Convert a scraped value such as '#1,234' to int, returning None when no number is present
+
+    Parameters
+    ----------
+    v : object
+        Raw scraped value.
+
+    Returns
+    -------
+    int
+        Parsed integer or None.
+
+    """
+    if v is None or isinstance(v, int):
+        return v
+    if isinstance(v, float):
+        return None if v != v else int(v)
+    s = str(v).replace(',', '').replace('#', '').strip()
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return int(float(s))
+        except ValueError:
+            return None
+
+def to_float(v):
+    """
+    Convert a scraped value such as '8.75' to float, returning None for placeholders like 'N/A'
+
+    Parameters
+    ----------
+    v : object
+        Raw scraped value.
+
+    Returns
+    -------
+    float
+        Parsed float or None.
+
+    """
+    if v is None:
+        return None
+    try:
+        f = float(str(v).replace(',', '').strip())
+    except ValueError:
+        return None
+    return None if f != f else f
+
+def to_str(v):
+    """
+    Convert a scraped value to str, returning None for empty values and the '?' placeholder
+
+    Parameters
+    ----------
+    v : object
+        Raw scraped value.
+
+    Returns
+    -------
+    str
+        Stripped string or None.
+
+    """
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    s = str(v).strip()
+    return None if s in ('', '?') else s
+
+def to_bool(v):
+    """
+    Convert a scraped value to bool, returning None when missing
+
+    Parameters
+    ----------
+    v : object
+        Raw scraped value.
+
+    Returns
+    -------
+    bool
+        Parsed boolean or None.
+
+    """
+    if v is None or isinstance(v, bool):
+        return v
+    s = str(v).strip().lower()
+    if s in ('true', '1'):
+        return True
+    if s in ('false', '0'):
+        return False
+    return None
+
+def to_list(v):
+    """
+    Keep scraped list values as lists, returning None when missing
+
+    Parameters
+    ----------
+    v : object
+        Raw scraped value.
+
+    Returns
+    -------
+    List
+        List value or None.
+
+    """
+    if v is None or isinstance(v, list):
+        return v
+    return list(v) if isinstance(v, tuple) else [v]
+
+
+CONVERTERS = {int: to_int, float: to_float, str: to_str, bool: to_bool, list: to_list}
+# pandas dtypes with native null support used when converting records to columns
+DTYPES = {int: 'Int64', float: 'float64', str: object, bool: 'boolean', list: object}
+
+
+def slot_names(fields):
+    """
+    Derive attribute names from .csv column names, e.g. 'Plan to Watch' -> 'plan_to_watch'
+
+    Parameters
+    ----------
+    fields : Tuple
+        Tuple of (column, type) pairs.
+
+    Returns
+    -------
+    Tuple[str]
+        Attribute names in column order.
+
+    """
+    return tuple(re.sub(r'\W+', '_', col).lower() for col, _ in fields)
+
+def format_value(v):
+    """
+    Format a record value for a text .csv cell, writing nulls as empty cells
+
+    Parameters
+    ----------
+    v : object
+        Record value.
+
+    Returns
+    -------
+    str
+        Cell text.
+
+    """
+    return '' if v is None else str(v)
+
+
+class Record:
+    """
+    Base class of the slotted scraper records.
+
+    Subclasses declare FIELDS as (column, type) pairs; values are converted to the declared type
+    when assigned, so missing or unparsable values are stored as None. Items are accessed by their
+    .csv column name, e.g. record['Plan to Watch'], or by attribute, e.g. record.plan_to_watch.
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, **values):
+        for slot in self.__slots__:
+            setattr(self, slot, None)
+        for col, v in values.items():
+            self[col] = v
+
+    @classmethod
+    def columns(cls):
+        return [col for col, _ in cls.FIELDS]
+
+    def keys(self):
+        return self.columns()
+
+    def __setitem__(self, col, v):
+        slot, typ = self._index[col]
+        setattr(self, slot, CONVERTERS[typ](v))
+
+    def __getitem__(self, col):
+        return getattr(self, self._index[col][0])
+
+    def to_row(self):
+        return [format_value(getattr(self, slot)) for slot in self.__slots__]
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{s}={getattr(self, s)!r}" for s in self.__slots__)})'
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._index = {col: (slot, typ) for (col, typ), slot in zip(cls.FIELDS, cls.__slots__)}
+
+
+class AnimeInfo(Record):
+    FIELDS = (('MAL_Id', int), ('Name', str), ('Synonyms_Name', str), ('Japanese_Name', str), ('English_Name', str),
+              ('Type', str), ('Episodes', int), ('Status', str), ('Aired', str), ('Premiered', str),
+              ('Producers', list), ('Licensors', list), ('Studios', list), ('Source', str), ('Genres', list),
+              ('Demographic', str), ('Duration', str), ('Rating', str), ('Score', float), ('Ranked', int),
+              ('Popularity', int), ('Members', int), ('Favorites', int), ('Watching', int), ('Completed', int),
+              ('On-Hold', int), ('Dropped', int), ('Plan to Watch', int), ('Total', int),
+              ('Score-10', int), ('Score-9', int), ('Score-8', int), ('Score-7', int), ('Score-6', int),
+              ('Score-5', int), ('Score-4', int), ('Score-3', int), ('Score-2', int), ('Score-1', int),
+              ('Synopsis', str), ('Voice_Actors', list), ('Recommended_Ids', list), ('Recommended_Counts', list))
+    __slots__ = slot_names(FIELDS)
+
+
+class Review(Record):
+    FIELDS = (('MAL_Id', int), ('Review', str), ('Tags', list))
+    __slots__ = slot_names(FIELDS)
+
+
+class TopAnimeRow(Record):
+    FIELDS = (('Id', int), ('Rank', int), ('Title', str), ('Rating', float), ('Image_URL', str),
+              ('Type', str), ('Episodes', int), ('Dates', str), ('Members', int))
+    __slots__ = slot_names(FIELDS)
+
+
+class RatingEntry(Record):
+    FIELDS = (('Username', str), ('User_Id', int), ('Anime_Id', int), ('Anime_Title', str), ('Rating_Status', str),
+              ('Rating_Score', int), ('Num_Epi_Watched', int), ('Is_Rewatching', bool), ('Updated', str),
+              ('Start_Date', str))
+    __slots__ = slot_names(FIELDS)
+
+
+def column_dtypes(cls):
+    """
+    Return the pandas dtype of each column of a record class, for reading written files back
+
+    Parameters
+    ----------
+    cls : type
+        Record subclass.
+
+    Returns
+    -------
+    Dict
+        Dict mapping column name to pandas dtype.
+
+    """
+    return {col: DTYPES[typ] for col, typ in cls.FIELDS}
+
+def records_to_frame(records, cls=None):
+    """
+    Convert a list of records to a DataFrame in one pass per column, keeping None as a real null
+
+    Parameters
+    ----------
+    records : List[Record]
+        Records of a single class.
+    cls : type, optional
+        Record class, required when records may be empty. The default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with one typed column per record field.
+
+    """
+    cls = cls or type(records[0])
+    return pd.DataFrame({col: pd.array([getattr(r, slot) for r in records], dtype=DTYPES[typ])
+                         for (col, typ), slot in zip(cls.FIELDS, cls.__slots__)})
+
+def write_records(file_name, records, delimiter='|'):
+    """
+    Append records to a .csv file, writing the header when the file is new
+
+    Parameters
+    ----------
+    file_name : str
+        File path / file name of the .csv file to write to.
+    records : List[Record]
+        Records of a single class.
+    delimiter : str, optional
+        Column delimiter. The default is '|'.
+
+    Returns
+    -------
+    None.
+
+    """
+    if not records:
+        return
+    df = records_to_frame(records)
+    df.to_csv(file_name, sep=delimiter, index=False, mode='a', header=not os.path.exists(file_name), lineterminator='\n')
@@ -6,6 +6,8 @@ import pandas as pd
 import random
 import re
 import csv
+from profiling import profiled, stage
+from records import AnimeInfo, Review, TopAnimeRow, format_value, to_int
 
 # Variables
 site_url = 'https://myanimelist.net'
@@ -83,8 +85,8 @@ def write_csv(items, path):
 
     Parameters
     ----------
-    items : Dict
-        Dictionary containing the relevant scraped categories and information.
+    items : List[TopAnimeRow]
+        List of records containing the relevant scraped categories and information.
     path : str
         File path or file name of the .csv file to save to.
 
@@ -107,7 +109,7 @@ def write_csv(items, path):
         for item in items:
             values = []
             for header in headers:
-                values.append(str(item.get(header, "")).replace(',',' '))
+                values.append(format_value(item[header]).replace(',',' '))
             f.write(','.join(values) + "\n")
             
 ### Extract high level information from row_contents
@@ -117,15 +119,15 @@ def extract_info(top_anime, row_contents):
 
     Parameters
     ----------
-    top_anime : List[Dict]
-        List of dictionaries containing information of top anime titles scraped thus far .
+    top_anime : List[TopAnimeRow]
+        List of records containing information of top anime titles scraped thus far .
     row_contents : bs4.element.ResultSet
         bs4 ResultSet of top anime titles found from scraped HTML.
 
     Returns
     -------
-    top_anime : List[Dict]
-        Updated list of dictionaries containing information of top anime titles scraped thus far .
+    top_anime : List[TopAnimeRow]
+        Updated list of records containing information of top anime titles scraped thus far .
     stop : Bool
         Returns True when non-scored anime title is found to trigger early stop condition.
 
@@ -134,23 +136,25 @@ def extract_info(top_anime, row_contents):
     for i in range(len(row_contents)):
         episode = parse_episodes(row_contents[i].find('div', class_ = "information di-ib mt4").text.strip().split('\n'))
         id_str = row_contents[i].find('td', class_='title al va-t word-break').find('a')['id']
-        ranking = {
-            'Id' : return_numeric(id_str),
-            'Rank' : row_contents[i].find('td', class_ = "rank ac").find('span').text,
-            'Title': row_contents[i].find('div', class_="di-ib clearfix").find('a').text,
-            'Rating': row_contents[i].find('td', class_="score ac fs14").find('span').text,
-            'Image_URL': row_contents[i].find('td', class_ ='title al va-t word-break').find('img')['data-src'],
-            'Type' : episode[0].split('(')[0].strip(),
-            'Episodes': return_numeric(episode[0].split('(')[1]),
-            'Dates': episode[1],
-            'Members': return_numeric(episode[2])
-        }
+        ranking = TopAnimeRow(
+            Id = return_numeric(id_str),
+            Rank = row_contents[i].find('td', class_ = "rank ac").find('span').text,
+            Title = row_contents[i].find('div', class_="di-ib clearfix").find('a').text,
+            Rating = row_contents[i].find('td', class_="score ac fs14").find('span').text,
+            Image_URL = row_contents[i].find('td', class_ ='title al va-t word-break').find('img')['data-src'],
+            Type = episode[0].split('(')[0].strip(),
+            Episodes = return_numeric(episode[0].split('(')[1]),
+            Dates = episode[1],
+            Members = return_numeric(episode[2])
+        )
         top_anime.append(ranking)
-        if ranking['Rating']=='N/A':
+        # 'N/A' ratings are parsed to None
+        if ranking['Rating'] is None:
             stop = True
     return top_anime, stop
 
-def scrape_top_anime(file_name='scrape_top_anime.csv', t=3):
+@profiled
+def scrape_top_anime(file_name='scrape_top_anime.csv', t=3, sink=None):
     """
     Loop to scrape top anime pages, stop when non-scored title is found.
 
@@ -160,6 +164,8 @@ def scrape_top_anime(file_name='scrape_top_anime.csv', t=3):
         File path or file name of .csv file to write to. The default is 'scrape_top_anime.csv'.
     t : int, optional
         Minimum time to wait between requests in seconds. The default is 3.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the top_anime rows into. The default is None.
 
     Returns
     -------
@@ -176,12 +182,18 @@ def scrape_top_anime(file_name='scrape_top_anime.csv', t=3):
         while response.status_code != 200:
             sleep()
             response = requests.get(top_anime_url + str(counts))
-        doc = BeautifulSoup(response.text)
-        row_contents = doc.find_all('tr', {'class':'ranking-list'})
-        top_anime, stop = extract_info(top_anime, row_contents)
+        with stage('top_anime'):
+            with stage('parse'):
+                doc = BeautifulSoup(response.text)
+            row_contents = doc.find_all('tr', {'class':'ranking-list'})
+            top_anime, stop = extract_info(top_anime, row_contents)
         counts += 50
     
-    write_csv(top_anime, file_name)
+    with stage('csv_write'):
+        write_csv(top_anime, file_name)
+    if sink is not None:
+        sink.upsert('top_anime', top_anime)
+        sink.flush()
     
 def get_link_by_text(soup, anime_id, text):
     """
@@ -205,7 +217,7 @@ def get_link_by_text(soup, anime_id, text):
     urls = list(filter(lambda x: str(anime_id) in x["href"], soup.find_all("a", text=text)))
     return urls[0]["href"]
 
-def get_request(link, req_head, anime_id):
+def get_request(link, req_head, anime_id, sink=None):
     """
     Helper function to try get request; if fail 3 times log the title id in .csv file
 
@@ -217,6 +229,8 @@ def get_request(link, req_head, anime_id):
         Request header for our sent request.
     anime_id : int
         Anime title ID on the website.
+    sink : SQLiteSink, optional
+        SQLite sink to also record the failed request in its log_id table. The default is None.
 
     Returns
     -------
@@ -245,6 +259,8 @@ def get_request(link, req_head, anime_id):
     with open('log_id.csv','a', encoding='utf-8') as f:
         writer = csv.writer(f, delimiter='|',lineterminator='\n')
         writer.writerow([anime_id, link])
+    if sink is not None:
+        sink.upsert('log_id', [(int(anime_id), link)])
 
 
 def get_review_tags(soup_tags, soup_reviews, anime_id):
@@ -262,8 +278,8 @@ def get_review_tags(soup_tags, soup_reviews, anime_id):
 
     Returns
     -------
-    output : List
-        List containing anime id, a single review entry, a list of associated tags.
+    output : List[Review]
+        List of records containing anime id, a single review entry, a list of associated tags.
 
     """
     extra_tags = ['Funny','Informative','Well-written','Creative','Preliminary']
@@ -287,7 +303,7 @@ def get_review_tags(soup_tags, soup_reviews, anime_id):
     rt =  list(zip(soup_reviews, review_tags))    
     for row in rt:
         r, t = row
-        output.append([anime_id, r, t])
+        output.append(Review(MAL_Id=anime_id, Review=r, Tags=t))
     return output
 
 
@@ -299,8 +315,8 @@ def write_new_reviews(file_name, l):
     ----------
     file_name : str
         File path / File name of .csv file to write to.
-    l : List
-        List of review entries.
+    l : List[Review]
+        List of review records.
 
     Returns
     -------
@@ -312,14 +328,14 @@ def write_new_reviews(file_name, l):
     if not file_name in os.listdir():
         with open(file_name,'w', encoding='utf-8') as f:
             writer = csv.writer(f, delimiter='|',lineterminator='\n')
-            headers = ['MAL_Id','Review','Tags']
+            headers = Review.columns()
             writer.writerow(headers)
     with open(file_name,'a', encoding='utf-8') as f:
         writer = csv.writer(f, delimiter='|',lineterminator='\n')
         for row in l:
-            writer.writerow(row)
+            writer.writerow(row.to_row())
         
-def get_reviews(link, anime_id, n=1):
+def get_reviews(link, anime_id, n=1, sink=None):
     """
     Extract nth page of reviews
 
@@ -329,6 +345,8 @@ def get_reviews(link, anime_id, n=1):
         Target url to scrape.
     anime_id : int
         Anime title ID on the website.
+    sink : SQLiteSink, optional
+        SQLite sink passed to get_request() to record a failed request in its log_id table. The default is None.
 
     Returns
     -------
@@ -341,15 +359,17 @@ def get_reviews(link, anime_id, n=1):
     sleep()
     review_link = f"{link}?p=" + str(n)
     #data = requests.get(review_link, header=req_head)
-    data = get_request(review_link, req_head, anime_id)
+    data = get_request(review_link, req_head, anime_id, sink)
     if data is None:
         return ['Error'],['Error']
-    soup = BeautifulSoup(data.text, "html.parser")
-    tags = soup.find_all("div", class_ = "tags")
-    reviews = soup.find_all("div", class_="text")
+    with stage('reviews'):
+        with stage('parse'):
+            soup = BeautifulSoup(data.text, "html.parser")
+        tags = soup.find_all("div", class_ = "tags")
+        reviews = soup.find_all("div", class_="text")
     return tags, reviews
     
-def get_recs(link_recommendations, anime_id):
+def get_recs(link_recommendations, anime_id, sink=None):
     """
     Extract recommended anime title and number of recommendations
 
@@ -359,36 +379,40 @@ def get_recs(link_recommendations, anime_id):
         url of target webpage to scrape.
     anime_id : int
         Anime title ID on the website.
+    sink : SQLiteSink, optional
+        SQLite sink passed to get_request() to record a failed request in its log_id table. The default is None.
 
     Returns
     -------
-    List
+    List[int]
         List of recommended anime ID for the target title.
-    List
+    List[int]
         List of counts each recommended anime ID has been voted.
 
     """
     sleep()
     #data = requests.get(link_recomendations, header=req_head)
-    data = get_request(link_recommendations, req_head, anime_id)
+    data = get_request(link_recommendations, req_head, anime_id, sink)
     if data is None:
         return ['Error'],['Error']
-    soup = BeautifulSoup(data.text, "html.parser")
-    soup.script.decompose()
-    rec_ids = []
-    rec_counts = []
-    soup_ids = soup.find_all('div', {'class':'hoverinfo'})
-    soup_rec_counts = soup.find_all('a', {'class':'js-similar-recommendations-button'})
-    for i in range(len(soup_ids)):
-        rec_id = return_numeric(soup_ids[i]['rel'])
-        rec_ids.append(rec_id)
-        if i < len(soup_rec_counts):
-            rec_counts.append(soup_rec_counts[i].find('strong').text)
-        else:
-            rec_counts.append('1')
+    with stage('recommendations'):
+        with stage('parse'):
+            soup = BeautifulSoup(data.text, "html.parser")
+        soup.script.decompose()
+        rec_ids = []
+        rec_counts = []
+        soup_ids = soup.find_all('div', {'class':'hoverinfo'})
+        soup_rec_counts = soup.find_all('a', {'class':'js-similar-recommendations-button'})
+        for i in range(len(soup_ids)):
+            rec_id = to_int(return_numeric(soup_ids[i]['rel']))
+            rec_ids.append(rec_id)
+            if i < len(soup_rec_counts):
+                rec_counts.append(to_int(soup_rec_counts[i].find('strong').text))
+            else:
+                rec_counts.append(1)
     return rec_ids, rec_counts
 
-def scrape_anime_info(link_stats, anime_id, anime_info):
+def scrape_anime_info(link_stats, anime_id, anime_info, sink=None):
     """
     Extract title details and statistics
 
@@ -398,69 +422,74 @@ def scrape_anime_info(link_stats, anime_id, anime_info):
         url of target webpage to scrape.
     anime_id : int
         Anime title ID on the website.
-    anime_info : Dict
-        Dict where keys are the relevant information that we are looking to scrape.
+    anime_info : AnimeInfo
+        Record where keys are the relevant information that we are looking to scrape.
+    sink : SQLiteSink, optional
+        SQLite sink passed to get_request() to record a failed request in its log_id table. The default is None.
 
     Returns
     -------
-    anime_info : Dict
-        Dict storing the updated scraped detailed anime information.
+    anime_info : AnimeInfo
+        Record storing the updated scraped detailed anime information.
 
     """
     # Get webpage
     #data = requests.get(link_stats, header=req_head)
-    data = get_request(link_stats, req_head, anime_id)
+    data = get_request(link_stats, req_head, anime_id, sink)
     if data is None:
         return anime_info
-    soup = BeautifulSoup(data.text, "html.parser")
-    soup.script.decompose()
+    with stage('stats'):
+        with stage('parse'):
+            soup = BeautifulSoup(data.text, "html.parser")
+        soup.script.decompose()
     
-    # Scrape and store information in dict
-    anime_info["MAL_Id"] = anime_id
-    anime_info["Name"] = soup.find("h1", {"class": "title-name h1_bold_none"}).text.strip()
+        # Scrape and store information in dict
+        anime_info["MAL_Id"] = anime_id
+        anime_info["Name"] = soup.find("h1", {"class": "title-name h1_bold_none"}).text.strip()
 
-    score = soup.find("span", {"itemprop": "ratingValue"})
-    if score is None:
-        score = '?'
-    try:
-        anime_info['Score'] = score.text.strip()
-    except:
-        print('Empty Score')
+        score = soup.find("span", {"itemprop": "ratingValue"})
+        if score is None:
+            score = '?'
+        try:
+            anime_info['Score'] = score.text.strip()
+        except:
+            print('Empty Score')
         
-    anime_info['Genres'] = [x.text.strip() for x in soup.findAll("span", {"itemprop": "genre"})]
-    try:
-        anime_info['Demographic'] = anime_info['Genres'][-1]
-    except:
-        print('Empty Genre')
-
-    for s in soup.findAll("span", {"class": "dark_text"}):
-        info = [x.strip().replace(" ", " ") for x in s.parent.text.split(":")]
-        cat, v = info[0], ":".join(info[1:])
-        v.replace("\t", "")
+        anime_info['Genres'] = [x.text.strip() for x in soup.findAll("span", {"itemprop": "genre"})]
+        try:
+            anime_info['Demographic'] = anime_info['Genres'][-1]
+        except:
+            print('Empty Genre')
+
+        with stage('dark_text'):
+            for s in soup.findAll("span", {"class": "dark_text"}):
+                info = [x.strip().replace(" ", " ") for x in s.parent.text.split(":")]
+                cat, v = info[0], ":".join(info[1:])
+                v.replace("\t", "")
         
-        if cat in ['Synonyms','Japanese','English']:
-            cat += '_Name'
-            v = v.replace(',', '')
-            anime_info[cat] = v
-            continue
-        if cat in ['Broadcast','Genres','Demographic','Score'] or cat not in anime_info.keys():
-            continue
-        elif cat in ['Producers','Licensors','Studios']:
-            v = [x.strip() for x in v.split(",")]
-        elif cat in ['Ranked','Popularity']:
-            v = v.replace('#',"")
-            v = v.replace(',', '')
-        elif cat in ['Members','Favorites','Watching','Completed','On-Hold','Dropped','Plan to Watch','Total']:
-            v = v.replace(',','')
+                if cat in ['Synonyms','Japanese','English']:
+                    cat += '_Name'
+                    v = v.replace(',', '')
+                    anime_info[cat] = v
+                    continue
+                if cat in ['Broadcast','Genres','Demographic','Score'] or cat not in anime_info.keys():
+                    continue
+                elif cat in ['Producers','Licensors','Studios']:
+                    v = [x.strip() for x in v.split(",")]
+                elif cat in ['Ranked','Popularity']:
+                    v = v.replace('#',"")
+                    v = v.replace(',', '')
+                elif cat in ['Members','Favorites','Watching','Completed','On-Hold','Dropped','Plan to Watch','Total']:
+                    v = v.replace(',','')
             
-        anime_info[cat] = v
-
-    # Scrape scoring stats
-    for s in soup.find("div", {"id": "horiznav_nav"}).parent.findAll(
-        "div", {"class": "updatesBar"}):
-        cat = f"Score-{s.parent.parent.parent.find('td', class_='score-label').text}"
-        v = ([x.strip() for x in s.parent.text.split("%")][-1].strip("(votes)"))
-        anime_info[cat] = str(v).strip()
+                anime_info[cat] = v
+
+        # Scrape scoring stats
+        for s in soup.find("div", {"id": "horiznav_nav"}).parent.findAll(
+            "div", {"class": "updatesBar"}):
+            cat = f"Score-{s.parent.parent.parent.find('td', class_='score-label').text}"
+            v = ([x.strip() for x in s.parent.text.split("%")][-1].strip("(votes)"))
+            anime_info[cat] = str(v).strip()
     return anime_info
 
 def write_new_row(file_name, d):
@@ -471,8 +500,8 @@ def write_new_row(file_name, d):
     ----------
     file_name : str
         File path or file name of .csv file to write to.
-    d : Dict
-        Dict storing the updated scraped detailed anime information.
+    d : AnimeInfo
+        Record storing the updated scraped detailed anime information.
 
     Returns
     -------
@@ -486,20 +515,19 @@ def write_new_row(file_name, d):
             writer.writerow(headers)
     with open(file_name,'a', encoding='utf-8') as f:
         writer = csv.writer(f, delimiter='|',lineterminator='\n')
-        values = []
-        for k, v in d.items():
-            values.append(str(v))
-        writer.writerow(values)
+        writer.writerow(d.to_row())
 
 # Scrape various information from the anime title through the links to its webpages
-def scrape_anime(anime_id):
+def scrape_anime(anime_id, sink=None):
     """
-    For a given anime ID, prepare the relevant urls to be scraped, and the Dict that will store the required information before calling scrape_anime_info() to scrape this information.
+    For a given anime ID, prepare the relevant urls to be scraped, and the AnimeInfo record that will store the required information before calling scrape_anime_info() to scrape this information.
 
     Parameters
     ----------
     anime_id : int
         Anime title ID on the website.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the title's anime_info and anime_reviews rows into, and record failed requests in. The default is None.
 
     Returns
     -------
@@ -513,42 +541,52 @@ def scrape_anime(anime_id):
     #os.makedirs(path, exist_ok=True)
     sleep()
     #data = requests.get(f"https://myanimelist.net/anime/{anime_id}", header=req_head)
-    data = get_request(f"https://myanimelist.net/anime/{anime_id}", req_head, anime_id)
+    data = get_request(f"https://myanimelist.net/anime/{anime_id}", req_head, anime_id, sink)
     if data is None:
         return
     
-    soup = BeautifulSoup(data.text, "html.parser")
-    soup.script.decompose()
-    va = []
-    for s in soup.find_all('td', class_='va-t ar pl4 pr4'):
-        va.append(s.a.text)
-    #save(f"{HTML_PATH}/{anime_id}/details.html", soup.prettify())
+    with stage('details'):
+        with stage('parse'):
+            soup = BeautifulSoup(data.text, "html.parser")
+        soup.script.decompose()
+        va = []
+        for s in soup.find_all('td', class_='va-t ar pl4 pr4'):
+            va.append(s.a.text)
+        #save(f"{HTML_PATH}/{anime_id}/details.html", soup.prettify())
     
-    # Get urls to detailed webpages
-    link_review = get_link_by_text(soup, anime_id, "Reviews")
-    link_recommendations = get_link_by_text(soup, anime_id, "Recommendations")
-    link_stats = get_link_by_text(soup, anime_id, "Stats")
+        # Get urls to detailed webpages
+        link_review = get_link_by_text(soup, anime_id, "Reviews")
+        link_recommendations = get_link_by_text(soup, anime_id, "Recommendations")
+        link_stats = get_link_by_text(soup, anime_id, "Stats")
     #link_staff = get_link_by_text(soup, anime_id, "Characters & Staff")
     
-    # Dict to store information
-    key_list = ['MAL_Id','Name','Synonyms_Name','Japanese_Name','English_Name','Type','Episodes','Status','Aired','Premiered','Producers','Licensors','Studios','Source','Genres','Demographic','Duration','Rating','Score','Ranked','Popularity','Members','Favorites','Watching','Completed','On-Hold','Dropped','Plan to Watch','Total','Score-10','Score-9', 'Score-8', 'Score-7', 'Score-6', 'Score-5', 'Score-4','Score-3', 'Score-2', 'Score-1','Synopsis','Voice_Actors','Recommended_Ids','Recommended_Counts']
-    anime_info = {key:'?' for key in key_list}
+    # Record to store information, unscraped fields are left as None
+    anime_info = AnimeInfo()
+    anime_info['MAL_Id'] = anime_id
     
     # Scrape relevant information from the urls
-    anime_info = scrape_anime_info(link_stats, anime_id, anime_info)
+    anime_info = scrape_anime_info(link_stats, anime_id, anime_info, sink)
     anime_info['Synopsis'] = soup.find('p', {'itemprop':'description'}).text.replace('\r','').replace('\n','').replace('\t','')    
     anime_info['Voice_Actors'] = va
-    rec_ids, rec_counts = get_recs(link_recommendations, anime_id)
+    rec_ids, rec_counts = get_recs(link_recommendations, anime_id, sink)
     anime_info['Recommended_Ids'] = rec_ids
     anime_info['Recommended_Counts'] = rec_counts
-    write_new_row('anime_info.csv', anime_info)
+    with stage('csv_write'):
+        write_new_row('anime_info.csv', anime_info)
+    if sink is not None:
+        sink.upsert('anime_info', [anime_info])
     
-    soup_tags, soup_reviews = get_reviews(link_review, anime_id)
+    soup_tags, soup_reviews = get_reviews(link_review, anime_id, sink=sink)
     if len(soup_tags) > 0 and len(soup_reviews) > 0:
-        review_data = get_review_tags(soup_tags, soup_reviews, anime_id)
-        write_new_reviews('anime_reviews.csv', review_data)
+        with stage('review_tags'):
+            review_data = get_review_tags(soup_tags, soup_reviews, anime_id)
+        with stage('csv_write'):
+            write_new_reviews('anime_reviews.csv', review_data)
+        if sink is not None:
+            sink.upsert('anime_reviews', review_data)
          
-def scrape_all_anime_info(anime_list_file_name, i=0):
+@profiled
+def scrape_all_anime_info(anime_list_file_name, i=0, sink=None):
     """
     Function to scrape all titles found within a given .csv file
 
@@ -558,6 +596,8 @@ def scrape_all_anime_info(anime_list_file_name, i=0):
         File path / file name of the .csv file containing the anime titles to scrape.
     i : int, optional
         Position in the file to start scraping from. The default is 0.
+    sink : SQLiteSink, optional
+        SQLite sink passed to scrape_anime(), flushed once every title is scraped. The default is None.
 
     Returns
     -------
@@ -566,8 +606,10 @@ def scrape_all_anime_info(anime_list_file_name, i=0):
     """
     df = pd.read_csv(anime_list_file_name)
     for aid in df.Id[i:]:
-        scrape_anime(aid)
+        scrape_anime(aid, sink)
         i+=1
         print(f'Latest Title: {aid}, Title Completed: {i}/13300')
         if not i%20:
-            print(time.asctime())
\ No newline at end of file
+            print(time.asctime())
+    if sink is not None:
+        sink.flush()
\ No newline at end of file
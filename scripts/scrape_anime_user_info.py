@@ -3,9 +3,10 @@ from bs4 import BeautifulSoup
 import requests
 import time
 import pandas as pd
-import numpy as np
 import random
 import csv
+from profiling import profiled, stage
+from records import RatingEntry, column_dtypes, write_records
 
 
 req_head = {'User-Agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:124.0) Gecko/20100101 Firefox/124.0',
@@ -109,17 +110,52 @@ def extract_usernames(data, current_set):
         DESCRIPTION.
 
     """
-    doc = BeautifulSoup(data.text)
-    usernames = []
-    for d in doc.find_all('td', class_='borderClass'):
-        username = d.find('div').text
-        if username not in current_set:
-            usernames.append(username)
+    with stage('users'):
+        with stage('parse'):
+            doc = BeautifulSoup(data.text)
+        usernames = []
+        for d in doc.find_all('td', class_='borderClass'):
+            username = d.find('div').text
+            if username not in current_set:
+                usernames.append(username)
     return usernames
 
+def parse_rating_entry(json, user_name, pos):
+    """
+    Extract a single entry of a user's anime list json into a RatingEntry record
+
+    Parameters
+    ----------
+    json : Dict
+        Single element of the 'data' field returned by the animelist API.
+    user_name : str
+        username string of our target user.
+    pos : int
+        id given to the username within this script.
+
+    Returns
+    -------
+    rating_entry : RatingEntry
+        Record of rating information for the entry, missing fields are None.
+
+    """
+    rating_entry = RatingEntry(
+        Username = user_name,
+        User_Id = pos,
+        Anime_Id = json['node'].get('id'),
+        Anime_Title = json['node'].get('title'),
+        Rating_Status = json['list_status'].get('status'),
+        Rating_Score = json['list_status'].get('score'),
+        Num_Epi_Watched = json['list_status'].get('num_episodes_watched'),
+        Is_Rewatching = json['list_status'].get('is_rewatching'),
+        Updated = json['list_status'].get('updated_at'),
+        Start_Date = json['list_status'].get('start_date')
+    )
+    return rating_entry
+
 def get_anime_list(data, user_name, pos, ratings_list):
     """
-    Extract json information into a list of dict
+    Extract json information into a list of RatingEntry records
 
     Parameters
     ----------
@@ -129,32 +165,69 @@ def get_anime_list(data, user_name, pos, ratings_list):
         username string of our target user.
     pos : int
         id given to the username within this script.
-    ratings_list : List
-        List containing a dictionary of information for each username.
+    ratings_list : List[RatingEntry]
+        List containing a record of information for each rating.
 
     Returns
     -------
-    ratings_list : List
-        List containing an updated dictionary of information for each username.
-    """
-    for i in range(len(data.json()['data'])):
-        json = data.json()['data'][i]
-        rating_entry = {
-            "Username" : user_name,
-            "User_Id" : pos,
-            "Anime_Id" : json['node'].get('id', np.nan),
-            "Anime_Title" : json['node'].get('title', np.nan),
-            "Rating_Status" : json['list_status'].get('status', np.nan),
-            "Rating_Score" : json['list_status'].get('score', np.nan),
-            "Num_Epi_Watched" : json['list_status'].get('num_episodes_watched', np.nan),
-            "Is_Rewatching" : json['list_status'].get('is_rewatching', np.nan),
-            "Updated" : json['list_status'].get('updated_at', np.nan),
-            "Start_Date" : json['list_status'].get('start_date', np.nan)
-        }
-        ratings_list.append(rating_entry)
+    ratings_list : List[RatingEntry]
+        List containing updated records of information for each rating.
+    """
+    with stage('animelist'):
+        for json in data.json()['data']:
+            ratings_list.append(parse_rating_entry(json, user_name, pos))
     return ratings_list
 
 
+def get_anime_list_delta(username, req_head, pos, watermark=None, page_limit=100):
+    """
+    Page through a user's anime list sorted by most recently updated, stopping once entries older than the watermark are reached
+
+    Parameters
+    ----------
+    username : str
+        username string of our target user.
+    req_head : Dict
+        Request headers to include in our request.
+    pos : int
+        id given to the username within this script.
+    watermark : str, optional
+        Latest 'updated_at' timestamp seen for this user on a previous sync. The default is None, which pages through the full list.
+    page_limit : int, optional
+        Number of entries requested per page once a watermark exists. The default is 100.
+
+    Returns
+    -------
+    ratings_list : List[RatingEntry]
+        List of records for entries updated after the watermark, None if the request failed.
+    newest : str
+        Most recent 'updated_at' timestamp seen, to be stored as the new watermark.
+
+    """
+    limit = 500 if watermark is None else page_limit
+    link = f'https://api.myanimelist.net/v2/users/{username}/animelist?limit={limit}&nsfw=true&fields=list_status&sort=list_updated_at'
+    ratings_list = []
+    newest = watermark
+    while link:
+        data = get_data(link, req_head)
+        if data is None:
+            return None, watermark
+        stop = False
+        with stage('animelist'):
+            page = data.json()
+            for json in page['data']:
+                updated = json['list_status'].get('updated_at')
+                # updated_at is an ISO 8601 UTC timestamp so string comparison preserves ordering
+                if watermark is not None and updated is not None and updated <= watermark:
+                    stop = True
+                    break
+                ratings_list.append(parse_rating_entry(json, username, pos))
+                if updated is not None and (newest is None or updated > newest):
+                    newest = updated
+        link = None if stop else page.get('paging', {}).get('next')
+    return ratings_list, newest
+
+
 def write_new_row_dict(file_name, d):
     """
     Helper function to write dict to csv as a new row
@@ -185,7 +258,8 @@ def write_new_row_dict(file_name, d):
             writer.writerow(values)
             
 #current_set = set()
-def scrape_users(req_head, file_name='usernames_list.csv', target=20000):
+@profiled
+def scrape_users(req_head, file_name='usernames_list.csv', target=20000, sink=None):
     """
     Scrape usernames from the user page
 
@@ -197,26 +271,38 @@ def scrape_users(req_head, file_name='usernames_list.csv', target=20000):
         File path / file name of our .csv file to write to. The default is 'usernames_list.csv'.
     target : int, optional
         Our target number of usernames. The default is 20000.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the scraped rows into. The default is None.
 
     Returns
     -------
     None.
 
     """
-    current_set = set(pd.read_csv(file_name, delimiter='|', header=None).values.ravel())
+    # Usernames keep their line position in the file as User_Id, so new ones start after the last line
+    existing = pd.read_csv(file_name, delimiter='|', header=None).values.ravel()
+    current_set = set(existing)
+    pos = len(existing)
     i = 0
     #req_head = {'User-Agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:124.0) Gecko/20100101 Firefox/124.0'}
     while i < target:
         data = get_data('https://myanimelist.net/users.php', req_head)
-        usernames = extract_usernames(data, current_set)
+        usernames = list(dict.fromkeys(extract_usernames(data, current_set)))
+        if sink is not None:
+            sink.upsert('usernames', [(pos + k, u) for k, u in enumerate(usernames)])
+        pos += len(usernames)
         current_set.update(usernames)
         
-        write_new_row(file_name, usernames)
+        with stage('csv_write'):
+            write_new_row(file_name, usernames)
         i = len(current_set)
         print(f'Current number of usernames found: {i}')
-        
+    if sink is not None:
+        sink.flush()
 
-def scrape_user_animelist(usernames, req_head, pos=0, log_file='skipped_users_list.csv', output_file='user_list_ratings.csv'):
+
+@profiled
+def scrape_user_animelist(usernames, req_head, pos=0, log_file='skipped_users_list.csv', output_file='user_list_ratings.csv', sink=None):
     """
     Scrape anime list information of each username within the list of usernames
 
@@ -232,6 +318,8 @@ def scrape_user_animelist(usernames, req_head, pos=0, log_file='skipped_users_li
         File path / file name of our .csv file to record usernames that encountered an error. The default is 'skipped_users_list.csv'.
     output_file : str, optional
         File path / file name of our .csv file to record our scraped data. The default is 'user_list_ratings.csv'.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the scraped rows into. The default is None.
 
     Returns
     -------
@@ -253,15 +341,199 @@ def scrape_user_animelist(usernames, req_head, pos=0, log_file='skipped_users_li
         if data is None:
             print(f'Current number of usernames processed: {pos} / {len(usernames)}')
             print(f'Skipping user {pos} as rate limited or user list is restricted')
-            write_new_row_dict('skipped_users_list.csv', [{'pos':pos, "username":username}])
+            log_skipped(log_file, pos, username)
+            if sink is not None:
+                sink.upsert('skipped_users', [(pos, username)])
             curr += 1
             pos += 1
             continue
         curr = 0
         ratings_list = get_anime_list(data, usernames[pos], pos, ratings_list)
         if len(ratings_list):
-            write_new_row_dict('user_ratings.csv', ratings_list)
+            with stage('csv_write'):
+                write_records('user_ratings.csv', ratings_list)
+            if sink is not None:
+                sink.upsert('user_ratings', ratings_list)
         
         print(f'Current number of usernames processed: {pos} / {len(usernames)}')
         pos += 1
-    
\ No newline at end of file
+    if sink is not None:
+        sink.flush()
+    
+
+
+def load_watermarks(file_name='user_watermarks.csv'):
+    """
+    Load the per-user 'updated_at' watermarks recorded by previous delta syncs
+
+    Parameters
+    ----------
+    file_name : str, optional
+        File path / file name of the watermark .csv file. The default is 'user_watermarks.csv'.
+
+    Returns
+    -------
+    Dict
+        Dict mapping username to the latest 'updated_at' timestamp synced.
+
+    """
+    if not os.path.exists(file_name):
+        return {}
+    df = pd.read_csv(file_name, delimiter='|', dtype=str, keep_default_na=False)
+    return dict(zip(df['username'], df['updated_at']))
+
+
+def write_watermarks(file_name, watermarks):
+    """
+    Overwrite the watermark .csv file with the current per-user watermarks
+
+    Parameters
+    ----------
+    file_name : str
+        File path / file name of the watermark .csv file.
+    watermarks : Dict
+        Dict mapping username to the latest 'updated_at' timestamp synced.
+
+    Returns
+    -------
+    None.
+
+    """
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name,'w', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='|',lineterminator='\n')
+        writer.writerow(['username','updated_at'])
+        for username, updated_at in watermarks.items():
+            writer.writerow([username, updated_at])
+    os.replace(tmp_name, file_name)
+
+
+def log_skipped(file_name, pos, username):
+    """
+    Helper function to record a skipped username in the skipped users .csv file
+
+    Parameters
+    ----------
+    file_name : str
+        File path / file name of the skipped users .csv file.
+    pos : int
+        id given to the username within this script.
+    username : str
+        username string of the skipped user.
+
+    Returns
+    -------
+    None.
+
+    """
+    new_file = not os.path.exists(file_name)
+    with open(file_name,'a', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter='|',lineterminator='\n')
+        if new_file:
+            writer.writerow(['pos','username'])
+        writer.writerow([pos, username])
+
+
+def load_ratings(file_name='user_ratings.csv'):
+    """
+    Load the ratings .csv file, keeping only the latest row for each (User_Id, Anime_Id)
+
+    Delta syncs append changed rows rather than rewriting the file, so older versions of a rating
+    remain in the file and are dropped here.
+
+    Parameters
+    ----------
+    file_name : str, optional
+        File path / file name of the ratings .csv file. The default is 'user_ratings.csv'.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame of ratings with one row per (User_Id, Anime_Id).
+
+    """
+    df = pd.read_csv(file_name, delimiter='|', dtype=column_dtypes(RatingEntry))
+    return df.drop_duplicates(['User_Id','Anime_Id'], keep='last').reset_index(drop=True)
+
+
+def compact_ratings(file_name='user_ratings.csv'):
+    """
+    Rewrite the ratings .csv file without superseded rows, to be run occasionally rather than per sync
+
+    Parameters
+    ----------
+    file_name : str, optional
+        File path / file name of the ratings .csv file. The default is 'user_ratings.csv'.
+
+    Returns
+    -------
+    None.
+
+    """
+    df = load_ratings(file_name)
+    tmp_name = file_name + '.tmp'
+    df.to_csv(tmp_name, sep='|', index=False, lineterminator='\n')
+    os.replace(tmp_name, file_name)
+
+
+@profiled
+def scrape_user_animelist_delta(usernames, req_head, pos=0, log_file='skipped_users_list.csv', output_file='user_ratings.csv', watermark_file='user_watermarks.csv', batch_size=100, page_limit=100, sink=None):
+    """
+    Incrementally sync anime list information of each username, only fetching entries updated since the previous sync
+
+    Lists are requested sorted by 'list_updated_at' and paging stops at the first entry at or older than the user's watermark,
+    so an unchanged user costs a single small request. Changed rows are appended to output_file every batch_size users;
+    load_ratings() keeps the latest row per (User_Id, Anime_Id) and compact_ratings() drops superseded rows from the file.
+    Entries removed from a user's list are not detected by this mode.
+
+    Parameters
+    ----------
+    usernames : List
+        List of usernames to scrape from.
+    req_head : Dict
+        Request headers to include in our request.
+    pos : int, optional
+        Current positional index from usernames. The default is 0.
+    log_file : str, optional
+        File path / file name of our .csv file to record usernames that encountered an error. The default is 'skipped_users_list.csv'.
+    output_file : str, optional
+        File path / file name of our .csv file to append our scraped data to. The default is 'user_ratings.csv'.
+    watermark_file : str, optional
+        File path / file name of our .csv file storing per-user watermarks. The default is 'user_watermarks.csv'.
+    batch_size : int, optional
+        Number of users to process between each write / watermark checkpoint. The default is 100.
+    page_limit : int, optional
+        Number of entries requested per page for users with a watermark. The default is 100.
+    sink : SQLiteSink, optional
+        SQLite sink to also upsert the scraped rows into. The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+    watermarks = load_watermarks(watermark_file)
+    pending = []
+    while pos < len(usernames):
+        username = usernames[pos]
+        ratings_list, newest = get_anime_list_delta(username, req_head, pos, watermarks.get(username), page_limit)
+        if ratings_list is None:
+            print(f'Skipping user {pos} as rate limited or user list is restricted')
+            log_skipped(log_file, pos, username)
+            if sink is not None:
+                sink.upsert('skipped_users', [(pos, username)])
+        else:
+            pending.extend(ratings_list)
+            if newest is not None:
+                watermarks[username] = newest
+            print(f'User {pos} / {len(usernames)}: {len(ratings_list)} updated entries')
+        pos += 1
+        # checkpoint ratings before watermarks so an interrupted run re-fetches rather than loses rows
+        if not pos % batch_size or pos == len(usernames):
+            with stage('csv_write'):
+                write_records(output_file, pending)
+                if sink is not None:
+                    sink.upsert('user_ratings', pending)
+                    sink.flush()
+                write_watermarks(watermark_file, watermarks)
+            pending = []
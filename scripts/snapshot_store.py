@@ -0,0 +1,345 @@
+import os
+import re
+import json
+import time
+import numpy as np
+import pandas as pd
+from records import records_to_frame
+
+STAT_FIELDS = ['Score','Ranked','Popularity','Members','Favorites','Watching','Completed','On-Hold','Dropped','Plan to Watch','Total',
+               'Score-10','Score-9','Score-8','Score-7','Score-6','Score-5','Score-4','Score-3','Score-2','Score-1']
+# Fields stored as scaled integers so that every series can be delta-encoded as int64
+SCALE = {'Score': 100}
+NULL = np.iinfo(np.int64).min
+MANIFEST = 'manifest.json'
+
+
+def field_dir(field):
+    """
+    Directory name of a field's chunks, e.g. 'Plan to Watch' -> 'plan_to_watch'
+
+    Parameters
+    ----------
+    field : str
+        Stat column name.
+
+    Returns
+    -------
+    str
+        Directory name.
+
+    """
+    return re.sub(r'\W+', '_', field).lower()
+
+def to_unix(t):
+    """
+    Convert a timestamp-like value to integer unix seconds, defaulting to the current time
+
+    Parameters
+    ----------
+    t : object
+        None, int or float unix seconds, datetime or string parsable by pandas.
+
+    Returns
+    -------
+    int
+        Unix seconds.
+
+    """
+    if t is None:
+        return int(time.time())
+    if isinstance(t, (int, np.integer, float, np.floating)):
+        return int(t)
+    return int(pd.Timestamp(t).timestamp())
+
+def load_manifest(store_dir):
+    """
+    Load the store manifest listing the chunks of each field
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the snapshot store.
+
+    Returns
+    -------
+    Dict
+        Manifest with 'refreshes' count, the 'state' file of latest values and 'fields' mapping field to a list of [t, kind, file] chunks.
+
+    """
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'refreshes': 0, 'state': None, 'fields': {field: [] for field in STAT_FIELDS}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def load_stats(source):
+    """
+    Load the stat columns of a snapshot as a sorted id array and an int64 value matrix
+
+    Parameters
+    ----------
+    source : str, pd.DataFrame or List[AnimeInfo]
+        anime_info .csv file, DataFrame of its columns, or scraped records.
+
+    Returns
+    -------
+    ids : np.ndarray
+        Sorted int32 MAL_Ids.
+    values : np.ndarray
+        int64 matrix of shape (len(ids), len(STAT_FIELDS)) with NULL for missing values.
+
+    """
+    if isinstance(source, str):
+        df = pd.read_csv(source, delimiter='|', usecols=['MAL_Id'] + STAT_FIELDS, dtype=str)
+    elif isinstance(source, pd.DataFrame):
+        df = source
+    else:
+        df = records_to_frame(source)
+    df = df.assign(MAL_Id=pd.to_numeric(df['MAL_Id'], errors='coerce')).dropna(subset=['MAL_Id'])
+    # Re-runs append rows to anime_info.csv, the latest row of each title wins
+    df = df.drop_duplicates('MAL_Id', keep='last').sort_values('MAL_Id')
+    values = np.empty((len(df), len(STAT_FIELDS)), dtype=np.int64)
+    for j, field in enumerate(STAT_FIELDS):
+        col = pd.to_numeric(df[field].astype(str).str.replace(',', ''), errors='coerce').to_numpy(dtype=np.float64)
+        col = np.round(col * SCALE.get(field, 1))
+        values[:, j] = np.where(np.isnan(col), NULL, np.nan_to_num(col)).astype(np.int64)
+    return df['MAL_Id'].to_numpy(dtype=np.int32), values
+
+def align(ids, values, new_ids):
+    """
+    Extend an id array and its values with any new ids, filling their values with NULL
+
+    Parameters
+    ----------
+    ids : np.ndarray
+        Sorted ids.
+    values : np.ndarray
+        Values aligned with ids, 1-d or 2-d.
+    new_ids : np.ndarray
+        Sorted ids that must be present.
+
+    Returns
+    -------
+    ids : np.ndarray
+        Sorted union of both id arrays.
+    values : np.ndarray
+        Values aligned with the union.
+
+    """
+    all_ids = np.union1d(ids, new_ids).astype(np.int32)
+    if len(all_ids) == len(ids):
+        return ids, values
+    out = np.full((len(all_ids),) + values.shape[1:], NULL, dtype=np.int64)
+    out[np.searchsorted(all_ids, ids)] = values
+    return all_ids, out
+
+def append_snapshot(store_dir='anime_stats', source='anime_info.csv', t=None, keyframe_every=30):
+    """
+    Append a refresh of title statistics to the snapshot store, writing only the values that changed
+
+    Each field is stored as a series of compressed chunks: a keyframe with every title's value every
+    keyframe_every refreshes, and in between a delta chunk holding only the titles whose value changed,
+    as delta-encoded ids and value differences. Missing values in a refresh are treated as not observed.
+
+    Parameters
+    ----------
+    store_dir : str, optional
+        Directory of the snapshot store. The default is 'anime_stats'.
+    source : str, pd.DataFrame or List[AnimeInfo], optional
+        Snapshot to append. The default is 'anime_info.csv'.
+    t : object, optional
+        Time of the snapshot, unix seconds, datetime or string. The default is None, the current time.
+    keyframe_every : int, optional
+        Number of refreshes between keyframes. The default is 30.
+
+    Returns
+    -------
+    None.
+
+    """
+    t = to_unix(t)
+    manifest = load_manifest(store_dir)
+    if manifest['state'] is not None:
+        with np.load(os.path.join(store_dir, manifest['state'])) as state:
+            ids, values = state['ids'], state['values']
+    else:
+        ids, values = np.empty(0, dtype=np.int32), np.empty((0, len(STAT_FIELDS)), dtype=np.int64)
+
+    new_ids, new_values = load_stats(source)
+    ids, values = align(ids, values, new_ids)
+    idx = np.searchsorted(ids, new_ids)
+    old = values[idx]
+    changed = (new_values != NULL) & (new_values != old)
+    keyframe = manifest['refreshes'] % keyframe_every == 0
+    values[idx] = np.where(changed, new_values, old)
+
+    n_changed = 0
+    for j, field in enumerate(STAT_FIELDS):
+        os.makedirs(os.path.join(store_dir, field_dir(field)), exist_ok=True)
+        chunks = manifest['fields'].setdefault(field, [])
+        file_name = os.path.join(field_dir(field), f'{t}_{len(chunks)}.npz')
+        if keyframe:
+            np.savez_compressed(os.path.join(store_dir, file_name), ids=np.diff(ids, prepend=0).astype(np.int32), values=values[:, j])
+            chunks.append([t, 'key', file_name])
+            continue
+        mask = changed[:, j]
+        if not mask.any():
+            continue
+        n_changed += int(mask.sum())
+        c_ids = new_ids[mask]
+        base = np.where(old[mask, j] == NULL, 0, old[mask, j])
+        np.savez_compressed(os.path.join(store_dir, file_name), ids=np.diff(c_ids, prepend=0).astype(np.int32), deltas=new_values[mask, j] - base)
+        chunks.append([t, 'delta', file_name])
+
+    # Chunks and state are written before the manifest that references them, so an interrupted refresh leaves the store unchanged
+    old_state = manifest['state']
+    manifest['state'] = f"state_{manifest['refreshes']}.npz"
+    np.savez(os.path.join(store_dir, manifest['state']), ids=ids, values=values)
+    manifest['refreshes'] += 1
+    with open(os.path.join(store_dir, MANIFEST + '.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(store_dir, MANIFEST + '.tmp'), os.path.join(store_dir, MANIFEST))
+    if old_state is not None:
+        os.remove(os.path.join(store_dir, old_state))
+    print(f"Snapshot {t}: {'keyframe' if keyframe else f'{n_changed} changed values'} for {len(new_ids)} titles")
+
+def replay(store_dir, field, t0, t1, on_change=None):
+    """
+    Reconstruct a field's values at t0 then apply its chunks up to t1, reading only that field's chunks from the last keyframe at or before t0
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the snapshot store.
+    field : str
+        Stat column name.
+    t0 : int
+        Start of the range in unix seconds.
+    t1 : int
+        End of the range in unix seconds.
+    on_change : Callable, optional
+        Called as on_change(t, ids, values) for each chunk in (t0, t1]. The default is None.
+
+    Returns
+    -------
+    ids : np.ndarray
+        Sorted ids.
+    start : np.ndarray
+        int64 values at t0, NULL where unknown.
+    end : np.ndarray
+        int64 values at t1, NULL where unknown.
+
+    """
+    chunks = [c for c in load_manifest(store_dir)['fields'].get(field, []) if c[0] <= t1]
+    keys = [i for i, c in enumerate(chunks) if c[1] == 'key' and c[0] <= t0]
+    chunks = chunks[keys[-1] if keys else 0:]
+    ids, vals = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    start = None
+    for t, kind, file_name in chunks:
+        if t > t0 and start is None:
+            start = (ids, vals.copy())
+        with np.load(os.path.join(store_dir, file_name)) as chunk:
+            c_ids = np.cumsum(chunk['ids'], dtype=np.int64).astype(np.int32)
+            if kind == 'key':
+                prev = align(ids, vals, c_ids)[1]
+                ids, vals = c_ids, chunk['values'].copy()
+                # A keyframe inside the range only reports the values that differ from the replayed state
+                c_ids = c_ids[vals != prev]
+            else:
+                ids, vals = align(ids, vals, c_ids)
+                idx = np.searchsorted(ids, c_ids)
+                vals[idx] = np.where(vals[idx] == NULL, 0, vals[idx]) + chunk['deltas']
+        if t > t0 and on_change is not None and len(c_ids):
+            on_change(t, c_ids, vals[np.searchsorted(ids, c_ids)])
+    if start is None:
+        start = (ids, vals.copy())
+    _, start_vals = align(start[0], start[1], ids)
+    return ids, start_vals, vals
+
+def to_float(values, field):
+    """
+    Convert stored int64 values back to floats in the field's units, with NaN for NULL
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Stored int64 values.
+    field : str
+        Stat column name.
+
+    Returns
+    -------
+    np.ndarray
+        float64 values.
+
+    """
+    out = values.astype(np.float64) / SCALE.get(field, 1)
+    out[values == NULL] = np.nan
+    return out
+
+def field_growth(store_dir='anime_stats', field='Members', t0=None, t1=None, days=90):
+    """
+    Change of a field for every title between two times, e.g. members growth over the last 90 days
+
+    Parameters
+    ----------
+    store_dir : str, optional
+        Directory of the snapshot store. The default is 'anime_stats'.
+    field : str, optional
+        Stat column name. The default is 'Members'.
+    t0 : object, optional
+        Start of the range. The default is None, days before t1.
+    t1 : object, optional
+        End of the range. The default is None, the current time.
+    days : int, optional
+        Length of the range when t0 is not given. The default is 90.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with MAL_Id, Start, End and Change columns.
+
+    """
+    t1 = to_unix(t1)
+    t0 = to_unix(t0) if t0 is not None else t1 - days * 86400
+    ids, start, end = replay(store_dir, field, t0, t1)
+    start, end = to_float(start, field), to_float(end, field)
+    return pd.DataFrame({'MAL_Id': ids, 'Start': start, 'End': end, 'Change': end - start})
+
+def field_series(store_dir='anime_stats', field='Members', t0=None, t1=None, ids=None):
+    """
+    Time-series of a field between two times, as the value at t0 followed by each recorded change
+
+    Parameters
+    ----------
+    store_dir : str, optional
+        Directory of the snapshot store. The default is 'anime_stats'.
+    field : str, optional
+        Stat column name. The default is 'Members'.
+    t0 : object, optional
+        Start of the range. The default is None, the start of the store.
+    t1 : object, optional
+        End of the range. The default is None, the current time.
+    ids : List[int], optional
+        Restrict the result to these MAL_Ids. The default is None, all titles.
+
+    Returns
+    -------
+    pd.DataFrame
+        Long DataFrame with MAL_Id, Time and field columns.
+
+    """
+    t0 = to_unix(t0) if t0 is not None else 0
+    t1 = to_unix(t1)
+    parts = []
+    def on_change(t, c_ids, c_vals):
+        parts.append((np.full(len(c_ids), t, dtype=np.int64), c_ids, c_vals))
+    s_ids, start, _ = replay(store_dir, field, t0, t1, on_change)
+    known = start != NULL
+    parts.insert(0, (np.full(int(known.sum()), t0, dtype=np.int64), s_ids[known], start[known]))
+    times, all_ids, vals = (np.concatenate(x) for x in zip(*parts))
+    df = pd.DataFrame({'MAL_Id': all_ids, 'Time': pd.to_datetime(times, unit='s'), field: to_float(vals, field)})
+    if ids is not None:
+        df = df[df['MAL_Id'].isin(ids)]
+    return df.sort_values(['MAL_Id', 'Time'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,195 @@
+import hashlib
+import sqlite3
+import threading
+from records import AnimeInfo, Review, TopAnimeRow, RatingEntry
+
+SQL_TYPES = {int: 'INTEGER', float: 'REAL', str: 'TEXT', bool: 'INTEGER', list: 'TEXT'}
+
+
+def sql_value(v):
+    """
+    Convert a record value to a value sqlite3 can bind, storing lists as their string form like the .csv files
+
+    Parameters
+    ----------
+    v : object
+        Record value.
+
+    Returns
+    -------
+    object
+        None, int, float or str.
+
+    """
+    return str(v) if isinstance(v, list) else v
+
+def record_row(record):
+    """
+    Return the bindable values of a record in column order
+
+    Parameters
+    ----------
+    record : Record
+        Scraped record.
+
+    Returns
+    -------
+    Tuple
+        Column values.
+
+    """
+    return tuple(sql_value(getattr(record, slot)) for slot in record.__slots__)
+
+def review_hash(anime_id, review):
+    """
+    Natural key of a review, as reviews have no id on the reviews page
+
+    Parameters
+    ----------
+    anime_id : int
+        Anime title ID on the website.
+    review : str
+        Review text.
+
+    Returns
+    -------
+    str
+        sha1 hex digest of the title id and review text.
+
+    """
+    return hashlib.sha1(f'{anime_id}|{review}'.encode('utf-8')).hexdigest()
+
+def record_columns(cls):
+    """
+    Return (column, sql type) pairs of a record class
+
+    Parameters
+    ----------
+    cls : type
+        Record subclass.
+
+    Returns
+    -------
+    List[Tuple]
+        Column names and SQL types.
+
+    """
+    return [(col, SQL_TYPES[typ]) for col, typ in cls.FIELDS]
+
+
+# Table name -> (columns, natural key, indexed columns, row converter)
+TABLES = {
+    'anime_info': (record_columns(AnimeInfo), ['MAL_Id'], ['Name', 'Score', 'Members', 'Ranked'], record_row),
+    'anime_reviews': ([('Review_Hash', 'TEXT')] + record_columns(Review), ['Review_Hash'], ['MAL_Id'],
+                      lambda r: (review_hash(r.mal_id, r.review),) + record_row(r)),
+    'top_anime': (record_columns(TopAnimeRow), ['Id'], ['Rank'], record_row),
+    'user_ratings': (record_columns(RatingEntry), ['User_Id', 'Anime_Id'], ['Anime_Id', 'Username', 'Updated'], record_row),
+    'usernames': ([('Pos', 'INTEGER'), ('Username', 'TEXT')], ['Username'], ['Pos'], tuple),
+    'skipped_users': ([('Pos', 'INTEGER'), ('Username', 'TEXT')], ['Username'], ['Pos'], tuple),
+    'log_id': ([('MAL_Id', 'INTEGER'), ('URL', 'TEXT')], ['MAL_Id', 'URL'], [], tuple),
+}
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteSink:
+    """
+    Optional SQLite output for the scrapers, upserting rows on each table's natural key.
+
+    Rows are buffered and written in one transaction per batch. The database uses WAL mode so readers
+    are not blocked by the writer, and a busy timeout so several processes can share the file; within a
+    process the sink can be shared between worker threads.
+    """
+
+    def __init__(self, path='mal_scrape.db', batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffers = {table: [] for table in TABLES}
+        self.buffered = 0
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock, self.conn:
+            for table, (columns, key, indexes, _) in TABLES.items():
+                # Key columns are NOT NULL as SQLite allows NULLs in a primary key, which would never conflict on upsert
+                cols = ', '.join(f'{quote(c)} {t}' + (' NOT NULL' if c in key else '') for c, t in columns)
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({cols}, PRIMARY KEY ({", ".join(map(quote, key))}))')
+                for col in indexes:
+                    self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{col.lower()} ON {table} ({quote(col)})')
+
+    def upsert(self, table, rows):
+        """
+        Buffer rows for upsert into a table, flushing once batch_size rows are buffered.
+
+        Rows with a missing key value are rejected, as a single INTEGER key column is an alias of the
+        rowid and SQLite would assign it a new rowid instead of enforcing NOT NULL.
+
+        Parameters
+        ----------
+        table : str
+            Table name in TABLES.
+        rows : List
+            Records for record tables, tuples of column values otherwise.
+
+        Returns
+        -------
+        None.
+
+        """
+        columns, key, _, to_row = TABLES[table]
+        key_pos = [i for i, (c, _) in enumerate(columns) if c in key]
+        rows = [to_row(r) for r in rows]
+        for row in rows:
+            if any(row[i] is None for i in key_pos):
+                raise ValueError(f'Missing {", ".join(key)} key value in {table} row {row[:3]}')
+        with self.lock:
+            self.buffers[table].extend(rows)
+            self.buffered += len(rows)
+            if self.buffered >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows in a single transaction.
+
+        The buffers are only cleared once the transaction commits, so when any table fails, e.g. the
+        database stays locked past the busy timeout, the rollback leaves every row buffered for the next flush.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            if not self.buffered:
+                return
+            with self.conn:
+                for table, rows in self.buffers.items():
+                    if not rows:
+                        continue
+                    columns, key, _, _ = TABLES[table]
+                    names = [c for c, _ in columns]
+                    updates = ', '.join(f'{quote(c)}=excluded.{quote(c)}' for c in names if c not in key)
+                    sql = (f'INSERT INTO {table} ({", ".join(map(quote, names))}) VALUES ({", ".join("?" * len(names))}) '
+                           f'ON CONFLICT ({", ".join(map(quote, key))}) DO ' + (f'UPDATE SET {updates}' if updates else 'NOTHING'))
+                    self.conn.executemany(sql, rows)
+            for rows in self.buffers.values():
+                rows.clear()
+            self.buffered = 0
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,70 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+from snapshot_store import STAT_FIELDS, append_snapshot, field_growth, field_series, to_unix
+
+# Raw Members and Score of each title at each refresh, None where the title was not scraped yet
+TIMES = [1000, 2000, 3000, 4000]
+RAW = {
+    'Members': {1: [100, 150, 150, 400], 2: [50, 50, 60, 70], 3: [None, None, 10, 25]},
+    'Score': {1: [8.5, 8.51, 8.6, 8.6], 2: [7.0, 7.0, 7.0, 7.25], 3: [None, None, 6.5, 6.5]},
+}
+
+
+def snapshot(i):
+    ids = [mal_id for mal_id, series in RAW['Members'].items() if series[i] is not None]
+    df = pd.DataFrame({'MAL_Id': ids}).assign(**{field: '0' for field in STAT_FIELDS})
+    df['Members'] = [f"{RAW['Members'][mal_id][i]:,}" for mal_id in ids]
+    df['Score'] = [str(RAW['Score'][mal_id][i]) for mal_id in ids]
+    return df
+
+def build_store(tmp_path):
+    store_dir = str(tmp_path / 'anime_stats')
+    # Keyframes at the first and last refresh, deltas in between, and title 3 first seen in a delta
+    for i, t in enumerate(TIMES):
+        append_snapshot(store_dir, snapshot(i), t=t, keyframe_every=3)
+    return store_dir
+
+def expected_series(field, t0):
+    rows = []
+    for mal_id, series in RAW[field].items():
+        known = [v for t, v in zip(TIMES, series) if t <= t0 and v is not None]
+        last = known[-1] if known else None
+        if last is not None:
+            rows.append((mal_id, t0, last))
+        for t, v in zip(TIMES, series):
+            if t > t0 and v is not None and v != last:
+                rows.append((mal_id, t, v))
+                last = v
+    return rows
+
+
+def test_to_unix_float_is_seconds():
+    assert to_unix(1700000000.5) == 1700000000
+    assert to_unix(np.float64(1700000000.0)) == 1700000000
+    assert to_unix(np.int64(1700000000)) == 1700000000
+    assert to_unix('2023-11-14 22:13:20') == 1700000000
+
+def test_field_growth_matches_raw_values(tmp_path):
+    store_dir = build_store(tmp_path)
+    for field, raw in RAW.items():
+        for i0, i1 in [(0, 1), (0, 3), (1, 2), (1, 3), (2, 3)]:
+            df = field_growth(store_dir, field, t0=TIMES[i0], t1=TIMES[i1]).set_index('MAL_Id')
+            assert df.index.tolist() == [mal_id for mal_id, series in raw.items() if series[i1] is not None]
+            for mal_id, series in raw.items():
+                if series[i1] is None:
+                    continue
+                start = np.nan if series[i0] is None else series[i0]
+                np.testing.assert_allclose(df.loc[mal_id, ['Start', 'End']].to_numpy(dtype=float), [start, series[i1]])
+
+def test_field_series_matches_raw_values(tmp_path):
+    store_dir = build_store(tmp_path)
+    for field in RAW:
+        for t0 in [TIMES[0], 2500]:
+            df = field_series(store_dir, field, t0=t0, t1=TIMES[-1])
+            expected = expected_series(field, t0)
+            assert list(zip(df['MAL_Id'], df['Time'])) == [(m, pd.Timestamp(t, unit='s')) for m, t, _ in expected]
+            np.testing.assert_allclose(df[field].to_numpy(), [v for _, _, v in expected])
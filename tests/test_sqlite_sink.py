@@ -0,0 +1,58 @@
+import os
+import sys
+import sqlite3
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+from records import RatingEntry
+from sqlite_sink import SQLiteSink
+
+
+def rows(sink, table):
+    return sink.conn.execute(f'SELECT * FROM {table} ORDER BY 1').fetchall()
+
+
+def test_failed_flush_keeps_every_table_buffered(tmp_path):
+    sink = SQLiteSink(str(tmp_path / 'mal_scrape.db'))
+    sink.upsert('usernames', [(0, 'a'), (1, 'b')])
+    # A row that only fails inside the transaction, after the usernames rows were inserted
+    sink.buffers['skipped_users'].append((2, None))
+    sink.buffered += 1
+    with pytest.raises(sqlite3.IntegrityError):
+        sink.flush()
+    assert rows(sink, 'usernames') == []
+    assert sink.buffers['usernames'] == [(0, 'a'), (1, 'b')]
+    assert sink.buffered == 3
+
+    sink.buffers['skipped_users'][0] = (2, 'c')
+    sink.flush()
+    assert rows(sink, 'usernames') == [(0, 'a'), (1, 'b')]
+    assert rows(sink, 'skipped_users') == [(2, 'c')]
+    assert sink.buffered == 0 and not any(sink.buffers.values())
+    sink.close()
+
+def test_locked_database_keeps_rows_for_next_flush(tmp_path):
+    path = str(tmp_path / 'mal_scrape.db')
+    sink = SQLiteSink(path)
+    sink.conn.execute('PRAGMA busy_timeout=0')
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    sink.upsert('usernames', [(0, 'a')])
+    sink.upsert('skipped_users', [(1, 'b')])
+    with pytest.raises(sqlite3.OperationalError):
+        sink.flush()
+    assert sink.buffered == 2
+
+    other.execute('COMMIT')
+    other.close()
+    sink.flush()
+    assert rows(sink, 'usernames') == [(0, 'a')]
+    assert rows(sink, 'skipped_users') == [(1, 'b')]
+    sink.close()
+
+def test_missing_key_is_rejected(tmp_path):
+    sink = SQLiteSink(str(tmp_path / 'mal_scrape.db'))
+    with pytest.raises(ValueError):
+        sink.upsert('user_ratings', [RatingEntry(Username='a', User_Id=0)])
+    assert sink.buffered == 0
+    sink.close()